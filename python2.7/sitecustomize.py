@@ -1,7 +1,18 @@
 # install the apport exception handler if available
-try:
-    import apport_python_hook
-except ImportError:
-    pass
-else:
-    apport_python_hook.install()
+import sys
+
+
+def _apport_excepthook(exc_type, exc_obj, exc_tb):
+    # apport is only imported once an exception actually goes uncaught,
+    # so short-lived interpreters that exit cleanly never load it.
+    sys.excepthook = sys.__excepthook__
+    try:
+        import apport_python_hook
+    except ImportError:
+        pass
+    else:
+        apport_python_hook.install()
+    sys.excepthook(exc_type, exc_obj, exc_tb)
+
+
+sys.excepthook = _apport_excepthook
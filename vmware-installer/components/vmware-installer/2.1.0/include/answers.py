@@ -0,0 +1,345 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Unattended installs driven by an answer file.
+
+An answer file gathers what would otherwise be spread across VMWARE_*
+environment variables and the answers to each component's questions:
+
+   [environment]
+   eulasAgreed = yes
+   keepConfig = yes
+   skipModules = no
+
+   [vmware-workstation]
+   serialNumber = XXXXX-XXXXX-XXXXX-XXXXX-XXXXX
+
+   [vmware-workstation-server]
+   hostdUser = admin
+   httpsPort = 443
+
+Accepting the EULAs is an answer like any other: an unattended install
+requires eulasAgreed = yes, and only then is the bundle run with
+--eulas-agreed.
+
+Every answer is checked against the question it answers before the
+bundle is started, so a bad answer file fails in a second instead of
+part way through a transaction.  The bundle is then run in console mode
+with only required questions, every answer passed with --set-setting,
+and the outcome is written as JSON for fleet tooling to collect:
+
+   answers.py --answers FILE --bundle BUNDLE [--result FILE] [--log FILE]
+   answers.py --answers FILE --validate
+   answers.py --check-questions COMPONENTS
+
+This module only depends on the standard library and query.py.
+"""
+import ConfigParser
+import optparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+from query import ToJSON
+
+ENVIRONMENT = 'environment'
+
+# Answer file keys of the environment section and the variables they set.
+ENVIRONMENT_KEYS = {'keepConfig': 'VMWARE_KEEP_CONFIG',
+                    'skipModules': 'VMWARE_SKIP_MODULES',
+                    'skipServices': 'VMWARE_SKIP_SERVICES',
+                    'skipNetworking': 'VMWARE_SKIP_NETWORKING',
+                    'forceInstallInVM': 'VMWARE_FORCE_INSTALL_IN_VM'}
+
+# Environment section key accepting the EULAs, passed as --eulas-agreed.
+EULAS_AGREED = 'eulasAgreed'
+
+# The questions asked by each component's InitializeQuestions, as
+# (question type, options).  Keep in step with the component scripts;
+# --check-questions compares the two.
+QUESTIONS = {
+   'vmware-installer': {'prefix': ('Directory', {}),
+                        'initdir': ('InitDir', {}),
+                        'initscriptdir': ('InitScriptDir', {}),
+                        'installShortcuts': ('YesNo', {})},
+   'vmware-player-app': {'softwareUpdateEnabled': ('YesNo', {}),
+                         'dataCollectionEnabled': ('YesNo', {})},
+   'vmware-workstation': {'serialNumber': ('SerialNumber', {}),
+                          'nofileHardLimit': ('NumericEntry', {'min': 1024, 'max': 65536})},
+   'vmware-workstation-server': {'hostdUser': ('TextEntry', {}),
+                                 'datastore': ('Directory', {}),
+                                 'httpsPort': ('PortEntry', {})},
+   'vmware-vmx': {'ClosePrograms': ('ClosePrograms', {})},
+}
+
+# Questions answered through the environment section instead.
+ENVIRONMENT_QUESTIONS = {'keepConfigOnUninstall': 'keepConfig'}
+
+# Question types checked more strictly here than the component asks for.
+STRICTER = {'SerialNumber': 'TextEntry'}
+
+# A question asked with a literal key, ie:
+#    self.AddQuestion('TextEntry',
+#                     key='hostdUser',
+QUESTION = re.compile(r"[aA]ddQuestion\(\s*'(\w+)',\s*key='(\w+)'")
+
+SERIAL_NUMBER = re.compile(r'^[0-9A-Z]{5}(-[0-9A-Z]{5}){4}$', re.IGNORECASE)
+
+# Lines of installer output kept in the result.
+TAIL_LINES = 20
+
+class AnswerError(Exception):
+   pass
+
+def _checkYesNo(value, options):
+   if value not in ('yes', 'no'):
+      raise AnswerError('must be yes or no')
+
+def _checkNumeric(value, options):
+   try:
+      number = int(value)
+   except ValueError:
+      raise AnswerError('must be a number')
+   if not options.get('min', number) <= number <= options.get('max', number):
+      raise AnswerError('must be between %d and %d' % (options['min'], options['max']))
+
+def _checkPort(value, options):
+   _checkNumeric(value, {'min': 1, 'max': 65535})
+
+def _checkDirectory(value, options):
+   if not os.path.isabs(value):
+      raise AnswerError('must be an absolute path')
+   if os.path.exists(value) and not os.path.isdir(value):
+      raise AnswerError('exists and is not a directory')
+
+def _checkTextEntry(value, options):
+   if not value.strip():
+      raise AnswerError('must not be empty')
+
+def _checkSerialNumber(value, options):
+   if value and not SERIAL_NUMBER.match(value):
+      raise AnswerError('is not a license key')
+
+def _checkClosePrograms(value, options):
+   if value.lower() != 'yes':
+      raise AnswerError('must be yes')
+
+CHECKS = {'YesNo': _checkYesNo,
+          'NumericEntry': _checkNumeric,
+          'PortEntry': _checkPort,
+          'Directory': _checkDirectory,
+          'InitDir': _checkDirectory,
+          'InitScriptDir': _checkDirectory,
+          'TextEntry': _checkTextEntry,
+          'SerialNumber': _checkSerialNumber,
+          'ClosePrograms': _checkClosePrograms}
+
+def CheckQuestions(componentsDir):
+   """
+   Compare QUESTIONS with the questions the component scripts ask.  Only
+   questions asked with a literal key can be found this way.
+
+   @param componentsDir: Directory of <name>/<version>/<name>.py scripts
+   @returns: A list of error messages, empty if QUESTIONS is up to date
+   """
+   errors = []
+   for name in sorted(os.listdir(componentsDir)):
+      componentDir = os.path.join(componentsDir, name)
+      if not os.path.isdir(componentDir):
+         continue
+      for version in sorted(os.listdir(componentDir)):
+         script = os.path.join(componentDir, version, '%s.py' % name)
+         if not os.path.isfile(script):
+            continue
+         fd = open(script)
+         try:
+            # Questions that are commented out are not asked.
+            source = ''.join([line for line in fd
+                              if not line.lstrip().startswith('#')])
+         finally:
+            fd.close()
+         for questionType, key in sorted(set(QUESTION.findall(source))):
+            if key in ENVIRONMENT_QUESTIONS:
+               continue
+            if key not in QUESTIONS.get(name, {}):
+               errors.append('[%s] %s: missing from QUESTIONS' % (name, key))
+               continue
+            knownType = QUESTIONS[name][key][0]
+            if STRICTER.get(knownType, knownType) != questionType:
+               errors.append('[%s] %s: asked as %s, checked as %s'
+                             % (name, key, questionType, knownType))
+   return errors
+
+class Answers(object):
+   def __init__(self, answerFile):
+      """
+      @param answerFile: Path of the answer file
+      @raises AnswerError: If it cannot be parsed
+      """
+      self.parser = ConfigParser.RawConfigParser()
+      # Keys are case sensitive, as they are in the installer.
+      self.parser.optionxform = str
+      try:
+         if not self.parser.read(answerFile):
+            raise AnswerError('Unable to read %s' % answerFile)
+      except ConfigParser.Error, e:
+         raise AnswerError('Unable to parse %s: %s' % (answerFile, e))
+
+   def Validate(self):
+      """ @returns: A list of error messages, empty if the answers are valid """
+      errors = []
+      if not self.EulasAgreed():
+         errors.append('[%s] %s: must be yes for an unattended install'
+                       % (ENVIRONMENT, EULAS_AGREED))
+      for section in self.parser.sections():
+         if section == ENVIRONMENT:
+            for key, value in self.parser.items(section):
+               if key == EULAS_AGREED:
+                  continue
+               if key not in ENVIRONMENT_KEYS:
+                  errors.append('[%s] %s: unknown setting' % (section, key))
+               elif value not in ('yes', 'no'):
+                  errors.append('[%s] %s: must be yes or no' % (section, key))
+         elif section not in QUESTIONS:
+            errors.append('[%s]: unknown component' % section)
+         else:
+            for key, value in self.parser.items(section):
+               if key not in QUESTIONS[section]:
+                  errors.append('[%s] %s: %s asks no such question' % (section, key, section))
+                  continue
+               questionType, options = QUESTIONS[section][key]
+               try:
+                  CHECKS[questionType](value, options)
+               except AnswerError, e:
+                  errors.append('[%s] %s: %s' % (section, key, e))
+      return errors
+
+   def EulasAgreed(self):
+      """ @returns: True if the answer file accepts the EULAs """
+      return self.parser.has_option(ENVIRONMENT, EULAS_AGREED) and \
+             self.parser.get(ENVIRONMENT, EULAS_AGREED) == 'yes'
+
+   def Environment(self):
+      """ @returns: A dict of the VMWARE_* variables to set """
+      env = {}
+      if self.parser.has_section(ENVIRONMENT):
+         for key, value in self.parser.items(ENVIRONMENT):
+            if key == EULAS_AGREED:
+               continue
+            if key == 'keepConfig':
+               env[ENVIRONMENT_KEYS[key]] = value
+            elif value == 'yes':
+               env[ENVIRONMENT_KEYS[key]] = 'yes'
+      return env
+
+   def Settings(self):
+      """ @returns: A list of (component, key, value) to pass as settings """
+      settings = []
+      for section in self.parser.sections():
+         if section != ENVIRONMENT:
+            for key, value in self.parser.items(section):
+               settings.append((section, key, value))
+      return settings
+
+def Command(bundle, answers):
+   """ @returns: The argument list running bundle with answers """
+   argv = ['/bin/sh', bundle, '--console', '--required']
+   if answers.EulasAgreed():
+      argv.append('--eulas-agreed')
+   for component, key, value in answers.Settings():
+      argv.extend(['--set-setting', component, key, value])
+   return argv
+
+def _tail(fileName, lines=TAIL_LINES):
+   try:
+      fd = open(fileName)
+   except IOError:
+      return []
+   try:
+      fd.seek(0, 2)
+      fd.seek(max(0, fd.tell() - 16 * 1024))
+      return fd.read().splitlines()[-lines:]
+   finally:
+      fd.close()
+
+def Run(bundle, answers, logFile):
+   """
+   Run bundle unattended with answers, logging its output to logFile.
+
+   @returns: A result dict
+   """
+   env = dict(os.environ)
+   env.update(answers.Environment())
+   out = open(logFile, 'a')
+   start = time.time()
+   try:
+      try:
+         retCode = subprocess.call(Command(bundle, answers), env=env,
+                                   stdin=open(os.devnull), stdout=out,
+                                   stderr=subprocess.STDOUT)
+      except OSError, e:
+         return {'status': 'failed', 'errors': [str(e)], 'exitCode': None,
+                 'seconds': round(time.time() - start, 3), 'log': logFile, 'tail': []}
+   finally:
+      out.close()
+
+   result = {'status': retCode == 0 and 'installed' or 'failed',
+             'errors': [], 'exitCode': retCode,
+             'seconds': round(time.time() - start, 3), 'log': logFile, 'tail': []}
+   if retCode != 0:
+      result['tail'] = _tail(logFile)
+   return result
+
+def main(argv):
+   parser = optparse.OptionParser(usage='%prog --answers FILE [options]')
+   parser.add_option('--answers', metavar='FILE', help='The answer file.')
+   parser.add_option('--bundle', metavar='BUNDLE', help='The bundle to install.')
+   parser.add_option('--validate', action='store_true', default=False,
+                     help='Only validate the answer file.')
+   parser.add_option('--result', metavar='FILE',
+                     help='Write the JSON result to FILE instead of stdout.')
+   parser.add_option('--log', metavar='FILE', default='/var/log/vmware-unattended.log',
+                     help='Where to log the installer output.')
+   parser.add_option('--check-questions', metavar='DIR',
+                     help='Only check the known questions against the component '
+                          'scripts in DIR.')
+   options, args = parser.parse_args(argv)
+   if options.check_questions:
+      errors = CheckQuestions(options.check_questions)
+      for error in errors:
+         sys.stderr.write('%s\n' % error)
+      return errors and 1 or 0
+   if not options.answers or not (options.bundle or options.validate):
+      parser.error('--answers and either --bundle or --validate are required')
+
+   try:
+      answers = Answers(options.answers)
+      errors = answers.Validate()
+   except AnswerError, e:
+      errors = [str(e)]
+
+   if errors:
+      result = {'status': 'invalid', 'errors': errors, 'exitCode': None}
+   elif options.validate:
+      result = {'status': 'valid', 'errors': [], 'exitCode': None}
+   else:
+      result = Run(options.bundle, answers, options.log)
+
+   text = ToJSON(result) + '\n'
+   if options.result:
+      fd = open(options.result, 'w')
+      try:
+         fd.write(text)
+      finally:
+         fd.close()
+   else:
+      sys.stdout.write(text)
+
+   if result['status'] in ('valid', 'installed'):
+      return 0
+   return result['status'] == 'invalid' and 2 or 1
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
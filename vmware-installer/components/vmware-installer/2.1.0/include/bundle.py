@@ -0,0 +1,391 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Indexed random access to bundle payloads.
+
+A central index is appended to the end of the bundle, after the payload.
+It records the offset, compressed size, size and SHA-1 of every member so
+that a single file, such as doc/LearnMore.txt or initinfo/initinfo.lsb,
+can be read without extracting the whole payload first.  Members that are
+stored uncompressed can also be mapped into memory directly.
+
+Compressed members are split into chunks of CHUNK_SIZE bytes that are
+compressed independently.  The index keeps a seek table of the compressed
+size of every chunk, so Extract() can decompress all chunks of all
+members in parallel and write each one straight to its offset in the
+final destination file.
+
+Layout, all integers big endian:
+
+   member data ...
+   index:   count * (offset:Q, csize:Q, size:Q, sha1:20s, namelen:I, nchunks:I,
+                     name, nchunks * chunk csize:I)
+   trailer: magic:8s, index offset:Q, count:I, chunk size:I
+
+Stored members have no chunks.
+"""
+import hashlib
+import mmap
+import os
+import Queue
+import struct
+import threading
+import zlib
+
+from integrity import CpuCount
+
+MAGIC = 'VMISIDX2'
+ENTRY = '>QQQ20sII'
+CHUNK = '>I'
+TRAILER = '>8sQII'
+
+# Uncompressed size of each independently compressed chunk.
+CHUNK_SIZE = 1024 * 1024
+
+class BundleIndexError(Exception):
+   """ Raised for a missing, truncated or corrupt index or member """
+   pass
+
+def _runPool(work, handle, threads):
+   """
+   Drain a queue of work items across a pool of threads.
+
+   @param work: Queue of (tmp, ...) work items
+   @param handle: Called with every item and the thread's open bundle file
+   @param threads: Number of worker threads
+   @returns: A list of (tmp, exception) for every item that failed
+   """
+   errors = []
+   def worker():
+      while True:
+         try:
+            item = work.get_nowait()
+         except Queue.Empty:
+            return
+         try:
+            handle(*item)
+         except Exception, e:
+            errors.append((item[0], e))
+
+   pool = [threading.Thread(target=worker) for i in range(threads)]
+   for t in pool:
+      t.start()
+   for t in pool:
+      t.join()
+   return errors
+
+class BundleEntry(object):
+   def __init__(self, name, offset, csize, size, sha1, chunks):
+      self.name = name
+      self.offset = offset
+      self.csize = csize
+      self.size = size
+      self.sha1 = sha1
+      self.chunks = chunks
+
+   def IsStored(self):
+      """ True if the member is stored uncompressed and can be mapped """
+      return not self.chunks
+
+   def Chunks(self, chunkSize):
+      """
+      Walk the seek table.
+
+      @returns: A list of (compressed offset, compressed size,
+                uncompressed offset) for every chunk.
+      """
+      ret = []
+      offset = self.offset
+      for i in range(len(self.chunks)):
+         ret.append((offset, self.chunks[i], i * chunkSize))
+         offset += self.chunks[i]
+      return ret
+
+class BundleReader(object):
+   """
+   Read members of a bundle through its central index.
+
+   Only the trailer and index are read when the reader is created; member
+   data is read on demand.
+   """
+   def __init__(self, bundle):
+      self.bundle = bundle
+      self._file = open(bundle, 'rb')
+      self._map = None
+      self.entries = {}
+      try:
+         self._readIndex()
+      except:
+         self._file.close()
+         raise
+
+   def _readIndex(self):
+      trailerSize = struct.calcsize(TRAILER)
+      self._file.seek(0, 2)
+      end = self._file.tell()
+      if end < trailerSize:
+         raise BundleIndexError('%s has no index' % self.bundle)
+
+      self._file.seek(end - trailerSize)
+      magic, indexOffset, count, self.chunkSize = \
+         struct.unpack(TRAILER, self._file.read(trailerSize))
+      if magic != MAGIC:
+         raise BundleIndexError('%s has no index' % self.bundle)
+
+      self._file.seek(indexOffset)
+      index = self._file.read(end - trailerSize - indexOffset)
+      entrySize = struct.calcsize(ENTRY)
+      chunkSize = struct.calcsize(CHUNK)
+      pos = 0
+      for i in range(count):
+         if pos + entrySize > len(index):
+            raise BundleIndexError('Truncated index in %s' % self.bundle)
+         offset, csize, size, sha1, nameLen, nchunks = \
+            struct.unpack(ENTRY, index[pos:pos + entrySize])
+         pos += entrySize
+         name = index[pos:pos + nameLen]
+         pos += nameLen
+         chunks = struct.unpack('>%dI' % nchunks, index[pos:pos + nchunks * chunkSize])
+         pos += nchunks * chunkSize
+         self.entries[name] = BundleEntry(name, offset, csize, size, sha1, chunks)
+
+   def _entry(self, name):
+      try:
+         return self.entries[name]
+      except KeyError:
+         raise BundleIndexError('%s is not in %s' % (name, self.bundle))
+
+   def Names(self):
+      """ Returns the names of all indexed members """
+      return self.entries.keys()
+
+   def Read(self, name):
+      """
+      Read and verify a single member.
+
+      @param name: Member name, relative to the component, ie: doc/LearnMore.txt
+      @returns: The member's contents
+      """
+      entry = self._entry(name)
+      self._file.seek(entry.offset)
+      if entry.IsStored():
+         data = self._file.read(entry.csize)
+      else:
+         data = ''.join([zlib.decompress(self._file.read(csize))
+                         for csize in entry.chunks])
+      if len(data) != entry.size or hashlib.sha1(data).digest() != entry.sha1:
+         raise BundleIndexError('%s is corrupt in %s' % (name, self.bundle))
+      return data
+
+   def Map(self, name):
+      """
+      Map a stored member into memory without copying it.  Compressed
+      members cannot be mapped and are read instead.
+
+      The mapping is not verified against the stored hash.
+
+      @param name: Member name
+      @returns: A read-only buffer over the member's contents
+      """
+      entry = self._entry(name)
+      if not entry.IsStored():
+         return self.Read(name)
+      if self._map is None:
+         self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+      return buffer(self._map, entry.offset, entry.size)
+
+   def Extract(self, targets, threads=None):
+      """
+      Decompress members straight into their destinations.
+
+      Every chunk of every member is a separate work item, so a single
+      large member such as a Tools ISO is spread across all threads.  Each
+      chunk is written once, at its final offset, into a temporary file
+      next to the destination which is renamed into place once all of its
+      chunks are written.  Stored members are hashed as they are copied.
+      The chunks of compressed members are written out of order, so once
+      all of them are written each compressed member is re-read, again in
+      parallel, and hashed as a whole.  Nothing is renamed into place
+      unless every member matches its SHA-1.
+
+      @param targets: A list of (member name, destination, mode) tuples.
+      @param threads: Number of worker threads.  Defaults to the CPU count.
+      """
+      if threads is None:
+         threads = CpuCount()
+
+      work = Queue.Queue()
+      verify = Queue.Queue()
+      temps = []
+      for name, dest, mode in targets:
+         entry = self._entry(name)
+         dest = str(dest)
+         tmp = '%s.vmis-extract' % dest
+         destDir = os.path.dirname(dest)
+         if destDir and not os.path.isdir(destDir):
+            os.makedirs(destDir)
+
+         # Size the file up front so that chunks can be written in any order.
+         fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+         try:
+            os.ftruncate(fd, entry.size)
+         finally:
+            os.close(fd)
+         # The mode given to open() is subject to the umask.
+         os.chmod(tmp, mode)
+         temps.append((tmp, dest))
+
+         if entry.IsStored():
+            work.put((tmp, entry.offset, entry.csize, 0, entry.sha1))
+         else:
+            for offset, csize, destOffset in entry.Chunks(self.chunkSize):
+               work.put((tmp, offset, csize, destOffset, None))
+            verify.put((tmp, entry.sha1))
+
+      def write(tmp, offset, csize, destOffset, sha1):
+         src = open(self.bundle, 'rb')
+         fd = os.open(tmp, os.O_WRONLY)
+         try:
+            src.seek(offset)
+            os.lseek(fd, destOffset, 0)
+            if sha1 is None:
+               os.write(fd, zlib.decompress(src.read(csize)))
+            else:
+               # Stored members are copied, and hashed, in chunk sized pieces.
+               digest = hashlib.sha1()
+               remaining = csize
+               while remaining:
+                  data = src.read(min(remaining, self.chunkSize))
+                  if not data:
+                     raise BundleIndexError('Truncated member in %s' % self.bundle)
+                  digest.update(data)
+                  os.write(fd, data)
+                  remaining -= len(data)
+               if digest.digest() != sha1:
+                  raise BundleIndexError('Corrupt member in %s' % self.bundle)
+         finally:
+            os.close(fd)
+            src.close()
+
+      def check(tmp, sha1):
+         digest = hashlib.sha1()
+         fil = open(tmp, 'rb')
+         try:
+            data = fil.read(self.chunkSize)
+            while data:
+               digest.update(data)
+               data = fil.read(self.chunkSize)
+         finally:
+            fil.close()
+         if digest.digest() != sha1:
+            raise BundleIndexError('Corrupt member in %s' % self.bundle)
+
+      errors = _runPool(work, write, threads)
+      if not errors:
+         errors = _runPool(verify, check, threads)
+
+      if errors:
+         for tmp, dest in temps:
+            try:
+               os.unlink(tmp)
+            except OSError:
+               pass
+         tmp, e = errors[0]
+         raise BundleIndexError('Unable to extract %s: %s' % (tmp, e))
+
+      for tmp, dest in temps:
+         os.rename(tmp, dest)
+
+   def Close(self):
+      if self._map is not None:
+         self._map.close()
+         self._map = None
+      self._file.close()
+
+class BundleIndexWriter(object):
+   """
+   Append members and a central index to a bundle.
+
+   Members are appended after whatever the bundle already contains, so an
+   index can be added to an existing self-extracting bundle.
+   """
+   def __init__(self, bundle, chunkSize=CHUNK_SIZE):
+      """
+      @param bundle: The bundle to append to
+      @param chunkSize: Uncompressed size of each compressed chunk
+      """
+      self._file = open(bundle, 'ab')
+      self._chunkSize = chunkSize
+      self._entries = []
+
+   def _append(self, name, size, sha1, pieces, chunked):
+      """ Write out the pieces of a member and record it in the index """
+      self._file.seek(0, 2)
+      offset = self._file.tell()
+      csize = 0
+      chunks = []
+      for piece in pieces:
+         self._file.write(piece)
+         csize += len(piece)
+         if chunked:
+            chunks.append(len(piece))
+      self._entries.append((name, offset, csize, size, sha1, chunks))
+
+   def Add(self, name, data, compress=True):
+      """
+      Append a member.
+
+      @param name: Member name
+      @param data: The member's contents
+      @param compress: Compress the member.  Pass False for members that
+                       should be mappable or are already compressed.
+      """
+      sha1 = hashlib.sha1(data).digest()
+      if compress:
+         chunks = [zlib.compress(data[i:i + self._chunkSize], 9)
+                   for i in range(0, len(data), self._chunkSize)]
+         # Only keep it compressed if that is worth it, otherwise keep it mappable.
+         if sum([len(chunk) for chunk in chunks]) < len(data):
+            self._append(name, len(data), sha1, chunks, True)
+            return
+      self._append(name, len(data), sha1, [data], False)
+
+   def AddFile(self, name, fileName, compress=True):
+      """
+      Append the contents of fileName as member name.  The file is streamed
+      one chunk at a time, so large members such as ISOs are never held in
+      memory.
+      """
+      fil = open(fileName, 'rb')
+      sha1 = hashlib.sha1()
+      sizes = [0]
+      def pieces():
+         block = fil.read(self._chunkSize)
+         while block:
+            sha1.update(block)
+            sizes[0] += len(block)
+            if compress:
+               yield zlib.compress(block, 9)
+            else:
+               yield block
+            block = fil.read(self._chunkSize)
+      try:
+         self._append(name, 0, None, pieces(), compress)
+      finally:
+         fil.close()
+
+      # Fill in what is only known once the whole file has been read.
+      name, offset, csize, size, digest, chunks = self._entries[-1]
+      self._entries[-1] = (name, offset, csize, sizes[0], sha1.digest(), chunks)
+
+   def Close(self):
+      """ Write the index and trailer """
+      self._file.seek(0, 2)
+      indexOffset = self._file.tell()
+      for name, offset, csize, size, sha1, chunks in self._entries:
+         self._file.write(struct.pack(ENTRY, offset, csize, size, sha1, len(name), len(chunks)))
+         self._file.write(name)
+         self._file.write(struct.pack('>%dI' % len(chunks), *chunks))
+      self._file.write(struct.pack(TRAILER, MAGIC, indexOffset, len(self._entries),
+                                   self._chunkSize))
+      self._file.close()
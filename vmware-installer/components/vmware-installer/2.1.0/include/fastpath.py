@@ -0,0 +1,189 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Skip re-running a bundle that is already installed.
+
+Configuration management runs the same bundle again and again.  Each run
+goes through every hook of every component: files are copied again,
+configuration rewritten, services restarted and kernel modules rebuilt,
+for an installation that ends up exactly as it was.
+
+This checks, before the bundle is started, whether the components it
+carries are installed at the same version and build, and whether their
+files are still as the database recorded them.  If so, the bundle is not
+run at all.  Otherwise, or with --force or VMWARE_FORCE_REINSTALL set,
+the bundle is run with the remaining arguments:
+
+   fastpath.py [--force] VMware-Workstation-Full-12.0.0-2985596.x86_64.bundle [args]
+
+What the bundle carries is taken from its file name, which names the
+product, the primary component's version and build and the
+architecture, or from --expect.
+
+This module only depends on the standard library, integrity.py and
+resolver.py.
+"""
+import optparse
+import os
+import re
+import sqlite3
+import sys
+
+from integrity import QuickVerify
+from resolver import ParseConstraint
+
+DATABASE = '/etc/vmware-installer/database'
+
+# VMware-<product>-<version>-<build>.<arch>.bundle
+BUNDLE_NAME = re.compile(r'^VMware-(.+)-(\d+(?:\.\d+)*)-(\d+)\.([^.]+)\.bundle$')
+
+# The type of a product's primary component in the components table.
+PRIMARY = 0
+
+# Machine names, as in uname -m, that run a bundle of each architecture.
+ARCHES = {'i386': ('i386', 'i486', 'i586', 'i686'),
+          'x86_64': ('x86_64',)}
+
+def _installed(conn):
+   """ @returns: A dict of name to (version, buildNumber, type) """
+   return dict([(name, (version, buildNumber, ctype)) for name, version, buildNumber, ctype
+                in conn.execute('SELECT name, version, buildNumber, type FROM components')])
+
+def _dependencies(conn):
+   """ @returns: A dict of name to the names of the components it depends on """
+   deps = {}
+   for name, dependency in conn.execute('SELECT components.name, dependency '
+                                        'FROM component_dependencies JOIN components '
+                                        'ON components.id = component_dependencies.component_id'):
+      deps.setdefault(name, []).append(ParseConstraint(dependency).name)
+   return deps
+
+def _withDependencies(name, installed, deps):
+   """
+   @returns: name and the installed components it depends on, directly or
+             through others
+   """
+   names = []
+   pending = [name]
+   while pending:
+      name = pending.pop()
+      if name in names or name not in installed:
+         continue
+      names.append(name)
+      pending.extend(deps.get(name, ()))
+   return names
+
+def _primaryName(product):
+   """ @returns: The primary component name of a product, ie: Workstation-Full -> vmware-workstation """
+   if product.endswith('-Full'):
+      product = product[:-len('-Full')]
+   return 'vmware-%s' % product.lower()
+
+def _fromBundleName(bundle):
+   """
+   @returns: [(name, version, buildNumber)] of the primary component named
+             by bundle's file name, or None if the name is not understood
+             or the bundle is for another architecture
+   """
+   match = BUNDLE_NAME.match(os.path.basename(bundle))
+   if not match:
+      return None
+   product, version, buildNumber, arch = match.groups()
+   if os.uname()[4] not in ARCHES.get(arch, (arch,)):
+      return None
+   return [(_primaryName(product), version, buildNumber)]
+
+def _match(installed, deps, expected, bundle):
+   """
+   @param installed: As returned by _installed
+   @param deps: As returned by _dependencies
+   @returns: The names of the components the bundle would reinstall, or
+             None if any of them is not installed at the same version and
+             build
+   """
+   fromName = not expected
+   if fromName:
+      expected = _fromBundleName(bundle)
+      if not expected:
+         return None
+
+   names = []
+   for name, version, buildNumber in expected:
+      row = installed.get(name)
+      if row is None or row[0] != version or str(row[1]) != buildNumber:
+         return None
+      if fromName and row[2] != PRIMARY:
+         return None
+      names.append(name)
+
+   if fromName:
+      # The product's bundle carries its primary and everything it depends on.
+      return _withDependencies(names[0], installed, deps)
+   return names
+
+def IsInstalled(bundle, expected=(), database=DATABASE):
+   """
+   Check whether running bundle would change nothing.
+
+   @param bundle: Path of the bundle
+   @param expected: (name, version, buildNumber) of the components it
+                    carries, instead of deriving them from the file name
+   @returns: A tuple of (True if nothing would change, reason)
+   """
+   if not os.path.exists(database):
+      return False, 'nothing is installed'
+   conn = sqlite3.connect(database, timeout=5.0)
+   try:
+      names = _match(_installed(conn), _dependencies(conn), expected, bundle)
+   finally:
+      conn.close()
+   if not names:
+      return False, 'the installed versions differ'
+   for name in names:
+      drifted = QuickVerify(database, name)
+      if drifted:
+         return False, '%s has changed since it was installed' % drifted[0][0]
+   return True, 'already installed'
+
+def main(argv):
+   parser = optparse.OptionParser(usage='%prog [options] BUNDLE [bundle arguments]')
+   parser.disable_interspersed_args()
+   parser.add_option('--database', default=DATABASE,
+                     help='Installer database to check against.')
+   parser.add_option('--expect', action='append', default=[], metavar='NAME:VERSION:BUILD',
+                     help='A component the bundle carries.  May be repeated.')
+   parser.add_option('--force', action='store_true',
+                     default=bool(os.environ.get('VMWARE_FORCE_REINSTALL')),
+                     help='Run the bundle even if it is already installed.')
+   parser.add_option('--check', action='store_true', default=False,
+                     help='Only check; exit 0 if the bundle is installed, 1 if not.')
+   options, args = parser.parse_args(argv)
+   if not args:
+      parser.error('A bundle is required')
+   bundle = args[0]
+
+   expected = []
+   for item in options.expect:
+      fields = item.split(':')
+      if len(fields) != 3:
+         parser.error('--expect takes NAME:VERSION:BUILD')
+      expected.append(tuple(fields))
+
+   if options.force:
+      installed, reason = False, 'reinstall forced'
+   else:
+      try:
+         installed, reason = IsInstalled(bundle, expected, options.database)
+      except sqlite3.Error, e:
+         installed, reason = False, 'unable to read %s: %s' % (options.database, e)
+
+   sys.stdout.write('%s: %s\n' % (os.path.basename(bundle), reason))
+   if options.check:
+      return not installed and 1 or 0
+   if installed:
+      return 0
+   sys.stdout.flush()
+   os.execv('/bin/sh', ['/bin/sh', bundle] + args[1:])
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,331 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Golden images of a completed installation.
+
+Export writes one compressed tar holding a snapshot of the installer
+database, with its files, components and settings, followed by every
+registered file and the configuration generated outside the database:
+the bootstrap files, /etc/vmware/config and the hostd XML files.
+
+Replay unpacks an image onto an identical host in one streaming pass,
+with no component scripts run.  Only what depends on the host is then
+redone:
+
+   - kernel modules are kept if they were built for the running kernel
+     and are rebuilt with vmware-modconfig otherwise,
+   - the hostd HTTPS and authd ports are moved if they are taken,
+   - the init scripts are registered and the services started.
+
+This module only depends on the standard library:
+
+   image.py --export FILE
+   image.py --replay FILE [--force]
+"""
+import optparse
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tarfile
+
+DATABASE = '/etc/vmware-installer/database'
+VMWARE_CONFIG = '/etc/vmware/config'
+HOSTD_DIR = '/etc/vmware/hostd'
+PROXY_XML = HOSTD_DIR + '/proxy.xml'
+
+# Generated at install time but not registered with the database.
+EXTRA_FILES = ('/etc/vmware-installer/bootstrap',
+               '/etc/vmware/bootstrap',
+               VMWARE_CONFIG)
+
+# Archive name of the database snapshot.
+IMAGE_DATABASE = '.image/database'
+
+MODULES_DIR = '/lib/modules'
+
+# Services in the order they are started.
+SERVICES = ('vmware', 'vmware-USBArbitrator', 'vmware-workstation-server')
+
+DEFAULT_AUTHD_PORT = 902
+
+class ImageError(Exception):
+   pass
+
+def _snapshot(database, dest):
+   """
+   Copy database to dest in a single read transaction.  The rows are
+   copied rather than the file, which would miss whatever a WAL mode
+   database has not checkpointed yet.
+   """
+   if os.path.exists(dest):
+      os.unlink(dest)
+   src = sqlite3.connect(database, isolation_level=None)
+   try:
+      out = sqlite3.connect(dest)
+      try:
+         # Every read below sees the database as it was at the first one.
+         src.execute('BEGIN')
+         schema = src.execute('SELECT type, name, sql FROM sqlite_master '
+                              'WHERE sql NOT NULL').fetchall()
+         tables = [name for kind, name, sql in schema if kind == 'table']
+         for kind, name, sql in schema:
+            if kind == 'table' and not name.startswith('sqlite_'):
+               out.execute(sql)
+         for name in tables:
+            # sqlite_sequence is created along with the first AUTOINCREMENT table.
+            if name.startswith('sqlite_') and name != 'sqlite_sequence':
+               continue
+            rows = src.execute('SELECT * FROM "%s"' % name)
+            marks = ', '.join(['?'] * len(rows.description))
+            out.executemany('INSERT INTO "%s" VALUES (%s)' % (name, marks), rows)
+         # Indexes, triggers and views once the rows are in.
+         for kind, name, sql in schema:
+            if kind != 'table':
+               out.execute(sql)
+         # Not part of the schema, but it tells schema.py's layout apart.
+         userVersion = src.execute('PRAGMA user_version').fetchone()[0]
+         src.execute('COMMIT')
+         out.execute('PRAGMA user_version = %d' % userVersion)
+         out.commit()
+      finally:
+         out.close()
+   finally:
+      src.close()
+
+def _registeredFiles(database):
+   conn = sqlite3.connect(database)
+   try:
+      return [row[0] for row in conn.execute('SELECT path FROM files ORDER BY path')]
+   finally:
+      conn.close()
+
+def Export(image, database=DATABASE):
+   """
+   Write the installation recorded in database to image.
+
+   @returns: A list of registered files that were missing
+   """
+   tmpDatabase = '%s.database' % image
+   _snapshot(database, tmpDatabase)
+   missing = []
+   added = {}
+   tar = tarfile.open(image, 'w|gz')
+   try:
+      tar.add(tmpDatabase, IMAGE_DATABASE)
+      files = _registeredFiles(tmpDatabase) + list(EXTRA_FILES)
+      if os.path.isdir(HOSTD_DIR):
+         files.extend([os.path.join(HOSTD_DIR, f) for f in sorted(os.listdir(HOSTD_DIR))
+                       if f.endswith('.xml')])
+      for fil in files:
+         if fil in added:
+            continue
+         added[fil] = True
+         if not os.path.lexists(fil):
+            missing.append(fil)
+            continue
+         tar.add(fil, fil.lstrip('/'), recursive=False)
+   finally:
+      tar.close()
+      os.unlink(tmpDatabase)
+   return missing
+
+def _otherKernel(name, release):
+   """ @returns: True if name is a module built for another kernel """
+   prefix = MODULES_DIR.lstrip('/') + '/'
+   return name.startswith(prefix) and name[len(prefix):].split('/', 1)[0] != release
+
+def _extract(image, root):
+   """ Unpack image under root in one pass, the database last """
+   release = os.uname()[2]
+   tmpDatabase = '%s.replay' % DATABASE
+   found = False
+   tar = tarfile.open(image, 'r|gz')
+   try:
+      for member in tar:
+         if member.name == IMAGE_DATABASE:
+            if not os.path.isdir(os.path.dirname(DATABASE)):
+               os.makedirs(os.path.dirname(DATABASE))
+            src = tar.extractfile(member)
+            out = open(tmpDatabase, 'wb')
+            try:
+               out.write(src.read())
+            finally:
+               out.close()
+            found = True
+         elif not _otherKernel(member.name, release):
+            tar.extract(member, root)
+   finally:
+      tar.close()
+   if not found:
+      raise ImageError('%s holds no installer database' % image)
+
+   # Modules built for other kernels were not unpacked, so forget them.
+   conn = sqlite3.connect(tmpDatabase)
+   try:
+      skipped = [(row[0],) for row in conn.execute('SELECT path FROM files')
+                 if _otherKernel(row[0].lstrip('/'), release)]
+      conn.executemany('DELETE FROM files WHERE path = ?', skipped)
+      conn.commit()
+   finally:
+      conn.close()
+   os.rename(tmpDatabase, DATABASE)
+
+def _run(*argv):
+   sys.stdout.write('Running %s\n' % ' '.join(argv))
+   try:
+      return subprocess.call(argv)
+   except OSError, e:
+      sys.stderr.write('Unable to run %s: %s\n' % (argv[0], e))
+      return -1
+
+def _which(program):
+   for directory in os.environ.get('PATH', '/usr/sbin:/usr/bin:/sbin:/bin').split(':') + ['/sbin', '/usr/sbin']:
+      candidate = os.path.join(directory, program)
+      if os.access(candidate, os.X_OK):
+         return candidate
+   return None
+
+def _setting(key):
+   conn = sqlite3.connect(DATABASE)
+   try:
+      row = conn.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+   finally:
+      conn.close()
+   return row and row[0] or None
+
+def _bindir():
+   return os.path.join(_setting('prefix') or '/usr', 'bin')
+
+def _buildModules():
+   release = os.uname()[2]
+   if os.path.exists(os.path.join(MODULES_DIR, release, 'misc', 'vmmon.ko')):
+      sys.stdout.write('Kernel modules for %s are in the image\n' % release)
+      _run('depmod', '-a')
+   else:
+      _run('depmod', '-a')
+      _run(os.path.join(_bindir(), 'vmware-modconfig'), '--console', '--install-all')
+
+def _listening():
+   """ @returns: A dict of the TCP ports listened on """
+   ports = {}
+   for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+      try:
+         lines = open(table).readlines()[1:]
+      except IOError:
+         continue
+      for line in lines:
+         fields = line.split()
+         # State 0A is LISTEN.
+         if len(fields) > 3 and fields[3] == '0A':
+            ports[int(fields[1].rsplit(':', 1)[1], 16)] = True
+   return ports
+
+def _freePort(preferred, listening):
+   """ Prefer port preferred, otherwise scan down from 1023 as hostd does """
+   for port in [preferred] + range(1023, 0, -1):
+      if port not in listening:
+         return port
+   raise ImageError('No free port found')
+
+def _replaceInFile(fileName, pattern, replacement):
+   try:
+      text = open(fileName).read()
+   except IOError:
+      return
+   newText = re.sub(pattern, replacement, text)
+   if newText != text:
+      fd = open(fileName, 'w')
+      try:
+         fd.write(newText)
+      finally:
+         fd.close()
+
+def _selectPorts():
+   listening = _listening()
+   httpsPort = int(_setting('httpsPort') or 443)
+   if os.path.exists(PROXY_XML) and httpsPort in listening:
+      newPort = _freePort(httpsPort, listening)
+      sys.stdout.write('HTTPS port %d is taken, using %d\n' % (httpsPort, newPort))
+      _replaceInFile(PROXY_XML, r'<httpsPort>\d+</httpsPort>', '<httpsPort>%d</httpsPort>' % newPort)
+      conn = sqlite3.connect(DATABASE)
+      try:
+         conn.execute("UPDATE settings SET value = ? WHERE key = 'httpsPort'", (str(newPort),))
+         conn.commit()
+      finally:
+         conn.close()
+      listening[newPort] = True
+
+   if DEFAULT_AUTHD_PORT in listening:
+      newPort = _freePort(DEFAULT_AUTHD_PORT, listening)
+      sys.stdout.write('authd port %d is taken, using %d\n' % (DEFAULT_AUTHD_PORT, newPort))
+      _replaceInFile(VMWARE_CONFIG, r'(?m)^authd\.client\.port = .*$',
+                     'authd.client.port = "%d"' % newPort)
+
+def _startServices():
+   initScriptDir = _setting('initscriptdir')
+   if not initScriptDir:
+      return
+   # The same order of preference as initscript.InitConfigProgram.  With
+   # none of them, the rc?.d links were registered files and are in the
+   # image already.
+   register = None
+   for program, args in (('update-rc.d', ['defaults']), ('insserv', []),
+                         ('chkconfig', None)):
+      if _which(program):
+         register = (_which(program), args)
+         break
+
+   for name in SERVICES:
+      script = os.path.join(initScriptDir, name)
+      if not os.path.exists(script):
+         continue
+      if register:
+         program, args = register
+         if args is None:
+            _run(program, '--add', name)
+         else:
+            _run(program, name, *args)
+      _run(script, 'start')
+
+def Replay(image, root='/', force=False):
+   """
+   Install image onto this host and redo its host-specific configuration.
+
+   @param force: Replay over an existing installation
+   """
+   if os.path.exists(DATABASE) and not force:
+      raise ImageError('VMware products are already installed, see --force')
+   _extract(image, root)
+   _buildModules()
+   _selectPorts()
+   _startServices()
+
+def main(argv):
+   parser = optparse.OptionParser(usage='%prog --export FILE | --replay FILE')
+   parser.add_option('--database', default=DATABASE,
+                     help='Installer database to export.')
+   parser.add_option('--export', metavar='FILE',
+                     help='Write the installation to FILE.')
+   parser.add_option('--replay', metavar='FILE',
+                     help='Install the image in FILE.')
+   parser.add_option('--force', action='store_true', default=False,
+                     help='Replay over an existing installation.')
+   options, args = parser.parse_args(argv)
+   if bool(options.export) == bool(options.replay):
+      parser.error('Exactly one of --export and --replay is required')
+
+   try:
+      if options.export:
+         for fil in Export(options.export, options.database):
+            sys.stderr.write('Registered file is missing: %s\n' % fil)
+      else:
+         Replay(options.replay, force=options.force)
+   except (ImageError, IOError, OSError, sqlite3.Error, tarfile.TarError), e:
+      sys.stderr.write('%s\n' % e)
+      return 1
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,296 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Installed file verification and repair.
+
+The quick check compares what the database recorded for each file in the
+files table against a single lstat of the installed file.  The full check
+additionally hashes file contents against a bundle manifest, spreading the
+work across one thread per online CPU.  Repair re-copies only the files
+that were found to have drifted, from a directory laid out like the
+installed tree, such as an image.py export unpacked with tar.  A bundle
+cannot be used directly: where its files land is decided by the
+component scripts.
+
+This module only depends on the standard library so it can be run directly
+without loading the installer:
+
+   integrity.py [--full MANIFEST] [--repair SOURCEDIR] [component]
+"""
+import fnmatch
+import hashlib
+import optparse
+import os
+import Queue
+import shutil
+import sqlite3
+import stat
+import sys
+import threading
+
+DATABASE = '/etc/vmware-installer/database'
+
+# File types as stored in the type column of the files table.  Links
+# laid down with AddTarget('Link') are stored as regular files too.
+REGULAR_FILE = 0
+
+# Files the components make setuid root with SetPermission(..., SETUID).
+# A missing one is restored with its setuid bit.
+SETUID_FILES = ('*/lib/vmware/bin/vmware-vmx*', '*/sbin/vmware-authd', '*/bin/vmware-mount')
+
+# Read size used while hashing file contents.
+HASH_BLOCK_SIZE = 256 * 1024
+
+def _loadFiles(database, component=None):
+   """
+   Fetch the registered files for one or all components in a single query.
+
+   @param database: Path to the installer database
+   @param component: Component name, or None for every component
+
+   @returns: A list of (path, mtime, type, componentName) tuples, sorted by
+             path so that the following stats walk directories in order.
+   """
+   query = 'SELECT files.path, files.mtime, files.type, components.name ' \
+           'FROM files JOIN components ON files.component_id = components.id'
+   args = ()
+   if component:
+      query += ' WHERE components.name = ?'
+      args = (component,)
+   query += ' ORDER BY files.path'
+
+   conn = sqlite3.connect(str(database))
+   try:
+      return conn.execute(query, args).fetchall()
+   finally:
+      conn.close()
+
+def CpuCount():
+   """ Returns the number of online CPUs, 1 if it cannot be determined """
+   try:
+      return max(int(os.sysconf('SC_NPROCESSORS_ONLN')), 1)
+   except (AttributeError, ValueError, OSError):
+      return 1
+
+def _hashFile(fil, algorithm):
+   """ Returns the hex digest of the contents of fil """
+   digest = hashlib.new(algorithm)
+   fd = open(fil, 'rb')
+   try:
+      block = fd.read(HASH_BLOCK_SIZE)
+      while block:
+         digest.update(block)
+         block = fd.read(HASH_BLOCK_SIZE)
+   finally:
+      fd.close()
+   return digest.hexdigest()
+
+def LoadManifest(manifestFile):
+   """
+   Load a bundle manifest in sha1sum(1) format, one "digest  path" per line.
+
+   @param manifestFile: Path to the manifest
+
+   @returns: A dict mapping installed path to hex digest
+   """
+   manifest = {}
+   fd = open(manifestFile, 'r')
+   try:
+      for line in fd:
+         line = line.rstrip('\n')
+         if not line or line.startswith('#'):
+            continue
+         digest, fil = line.split(None, 1)
+         # sha1sum marks binary mode with a leading '*'
+         manifest[fil.lstrip('*')] = digest.lower()
+   finally:
+      fd.close()
+   return manifest
+
+def QuickVerify(database, component=None):
+   """
+   Compare the stored mtime and type of every registered file with the
+   installed file.  No file contents are read.
+
+   Config files are expected to be modified by the user, so only their
+   presence is checked.
+
+   @param database: Path to the installer database
+   @param component: Component name, or None for every component
+
+   @returns: A list of (path, componentName, reason) for every drifted file,
+             reason being one of 'missing', 'type' or 'mtime'.
+   """
+   drifted = []
+   for fil, mtime, fileType, name in _loadFiles(database, component):
+      try:
+         st = os.lstat(fil)
+      except OSError:
+         drifted.append((fil, name, 'missing'))
+         continue
+
+      if fileType != REGULAR_FILE or stat.S_ISLNK(st.st_mode):
+         continue
+
+      if not stat.S_ISREG(st.st_mode):
+         drifted.append((fil, name, 'type'))
+      elif int(st.st_mtime) != mtime:
+         drifted.append((fil, name, 'mtime'))
+
+   return drifted
+
+def FullVerify(database, manifest, component=None, algorithm='sha1', threads=None):
+   """
+   Run the quick check and then hash every remaining regular file that is
+   listed in the manifest.  Hashing is done by a pool of worker threads.
+
+   @param database: Path to the installer database
+   @param manifest: A dict mapping installed path to hex digest
+   @param component: Component name, or None for every component
+   @param algorithm: hashlib algorithm the manifest digests were made with
+   @param threads: Number of hashing threads.  Defaults to the CPU count.
+
+   @returns: A list of (path, componentName, reason) for every drifted file,
+             reason being one of 'missing', 'type', 'mtime' or 'content'.
+   """
+   drifted = QuickVerify(database, component)
+   seen = set([fil for fil, name, reason in drifted])
+
+   work = Queue.Queue()
+   for fil, mtime, fileType, name in _loadFiles(database, component):
+      if fil not in seen and fileType == REGULAR_FILE and fil in manifest:
+         work.put((fil, name))
+
+   lock = threading.Lock()
+   def worker():
+      while True:
+         try:
+            fil, name = work.get_nowait()
+         except Queue.Empty:
+            return
+         try:
+            ok = _hashFile(fil, algorithm) == manifest[fil]
+         except IOError:
+            ok = False
+         if not ok:
+            lock.acquire()
+            try:
+               drifted.append((fil, name, 'content'))
+            finally:
+               lock.release()
+
+   if threads is None:
+      threads = CpuCount()
+   pool = [threading.Thread(target=worker) for i in range(threads)]
+   for t in pool:
+      t.start()
+   for t in pool:
+      t.join()
+
+   drifted.sort()
+   return drifted
+
+def _copy(src, fil, tmp):
+   """
+   Copy src to tmp, with the mode and owner fil should have.  A file that
+   is still there keeps the mode and owner the installer gave it.  A
+   missing one is owned by root, with the permission bits of src and the
+   setuid bit if a component sets it.  Links are copied as links.
+   """
+   if os.path.islink(src):
+      os.symlink(os.readlink(src), tmp)
+      return
+
+   shutil.copyfile(src, tmp)
+   try:
+      st = os.lstat(fil)
+   except OSError:
+      st = None
+   if st is not None and stat.S_ISREG(st.st_mode):
+      mode, uid, gid = stat.S_IMODE(st.st_mode), st.st_uid, st.st_gid
+   else:
+      mode, uid, gid = stat.S_IMODE(os.stat(src).st_mode) & 0777, 0, 0
+      for pattern in SETUID_FILES:
+         if fnmatch.fnmatch(fil, pattern):
+            mode |= stat.S_ISUID
+   # chown clears the setuid bit, so it goes first.
+   os.chown(tmp, uid, gid)
+   os.chmod(tmp, mode)
+
+def Repair(database, drifted, source):
+   """
+   Re-copy only the drifted files and record their new mtime.
+
+   Each file is copied next to its destination and renamed into place so
+   that a running program never sees a partially written file.
+
+   @param database: Path to the installer database
+   @param drifted: The list returned by QuickVerify or FullVerify
+   @param source: Either a directory laid out like the installed tree or a
+                  callable mapping an installed path to its source file.
+
+   @returns: A list of paths that could not be repaired
+   """
+   if not callable(source):
+      root = source
+      source = lambda fil: os.path.join(root, fil.lstrip('/'))
+
+   repaired = []
+   failed = []
+   for fil, name, reason in drifted:
+      src = source(fil)
+      tmp = '%s.vmis-repair' % fil
+      try:
+         if not os.path.isdir(os.path.dirname(fil)):
+            os.makedirs(os.path.dirname(fil))
+         _copy(src, fil, tmp)
+         os.rename(tmp, fil)
+      except (IOError, OSError):
+         failed.append(fil)
+         try:
+            os.unlink(tmp)
+         except OSError:
+            pass
+         continue
+      repaired.append((int(os.lstat(fil).st_mtime), fil))
+
+   if repaired:
+      conn = sqlite3.connect(str(database))
+      try:
+         conn.executemany('UPDATE files SET mtime = ? WHERE path = ?', repaired)
+         conn.commit()
+      finally:
+         conn.close()
+
+   return failed
+
+def main(argv):
+   parser = optparse.OptionParser(usage='%prog [options] [component]')
+   parser.add_option('--database', default=DATABASE,
+                     help='Installer database to verify against.')
+   parser.add_option('--full', metavar='MANIFEST',
+                     help='Also hash file contents against a bundle manifest.')
+   parser.add_option('--repair', metavar='SOURCEDIR',
+                     help='Re-copy drifted files from SOURCEDIR, laid out like '
+                          'the installed tree.')
+   options, args = parser.parse_args(argv)
+   component = args and args[0] or None
+
+   if options.full:
+      drifted = FullVerify(options.database, LoadManifest(options.full), component)
+   else:
+      drifted = QuickVerify(options.database, component)
+
+   for fil, name, reason in drifted:
+      sys.stdout.write('%s\t%s\t%s\n' % (name, reason, fil))
+
+   if drifted and options.repair:
+      failed = Repair(options.database, drifted, options.repair)
+      for fil in failed:
+         sys.stderr.write('Unable to repair %s\n' % fil)
+      return failed and 1 or 0
+
+   return drifted and 1 or 0
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
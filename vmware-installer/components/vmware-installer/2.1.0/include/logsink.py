@@ -0,0 +1,186 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Asynchronous, buffered installer logging.
+
+Every component logs through the same log object, so attaching a sink
+to it takes the logging of all of them off the hook threads.  Messages
+are put on a bounded queue, unformatted, and a background writer hands
+them to the real log methods in batches.  Flush() waits for the writer
+to catch up and flushes the log's handlers once, which is what the
+hooks do at the end of each phase.
+
+When the queue is full, Debug and Info messages are dropped and
+counted rather than blocking the hook.  Warnings and errors are never
+dropped.  Debug and Info can also be sampled, keeping one message in N.
+The counts are logged when the sink is detached.
+
+The sink is only attached with VMWARE_ASYNC_LOG set.  VMWARE_LOG_SAMPLE
+sets the sampling, ie: 'Debug=10' keeps one Debug message in ten.
+"""
+import atexit
+import Queue
+import threading
+
+# Methods of the log object that are routed through the sink.
+LEVELS = ('Debug', 'Info', 'Warn', 'Error')
+# Levels that are dropped when the queue is full instead of waiting.
+DROPPABLE = ('Debug', 'Info')
+
+QUEUE_SIZE = 8192
+# Messages handed to the log per wakeup of the writer.
+BATCH_SIZE = 256
+
+# Set on the log object while a sink is attached to it.  Each
+# component loads its own copy of this module, so the log object is
+# the only place they can all find it.
+ATTRIBUTE = '_vmisLogSink'
+
+class LogSink(object):
+   def __init__(self, logger, sample=None, queueSize=QUEUE_SIZE):
+      """
+      @param logger: The log object to route through the sink
+      @param sample: A dict of level to N, keeping one message in N
+      @param queueSize: Maximum number of messages waiting to be written
+      """
+      self.logger = logger
+      self.sample = sample or {}
+      self.queue = Queue.Queue(queueSize)
+      self.methods = {}
+      self.seen = dict([(level, 0) for level in LEVELS])
+      self.dropped = dict([(level, 0) for level in LEVELS])
+      self.sampled = dict([(level, 0) for level in LEVELS])
+      self._lock = threading.Lock()
+      self._writer = None
+
+   def _enqueue(self, level, msg, args):
+      self._lock.acquire()
+      try:
+         self.seen[level] += 1
+         every = level in DROPPABLE and self.sample.get(level)
+         if every > 1 and self.seen[level] % every != 1:
+            self.sampled[level] += 1
+            return
+      finally:
+         self._lock.release()
+
+      if level in DROPPABLE:
+         try:
+            self.queue.put_nowait((level, msg, args))
+         except Queue.Full:
+            self._lock.acquire()
+            self.dropped[level] += 1
+            self._lock.release()
+      else:
+         self.queue.put((level, msg, args))
+
+   def _method(self, level):
+      def method(msg, *args):
+         self._enqueue(level, msg, args)
+      return method
+
+   def _write(self):
+      """ Body of the writer thread """
+      while True:
+         batch = [self.queue.get()]
+         while len(batch) < BATCH_SIZE:
+            try:
+               batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+               break
+         for item in batch:
+            if item is None:
+               self.queue.task_done()
+               return
+            level, msg, args = item
+            try:
+               self.methods[level](msg, *args)
+            except Exception:
+               # A bad format string must not stop the writer.
+               pass
+            self.queue.task_done()
+
+   def Attach(self):
+      """ Start routing the log's messages through the sink """
+      for level in LEVELS:
+         method = getattr(self.logger, level, None)
+         if method is not None:
+            self.methods[level] = method
+            setattr(self.logger, level, self._method(level))
+      setattr(self.logger, ATTRIBUTE, self)
+
+      self._writer = threading.Thread(target=self._write)
+      self._writer.setDaemon(True)
+      self._writer.start()
+      atexit.register(self.Detach)
+
+   def _flushHandlers(self):
+      for handler in getattr(self.logger, 'handlers', []):
+         handler.flush()
+
+   def Flush(self):
+      """ Wait until every queued message is written and flush the log """
+      if self._writer is None:
+         return
+      self.queue.join()
+      self._flushHandlers()
+
+   def Detach(self):
+      """ Write what is queued, log the counters and restore the log """
+      if self._writer is None:
+         return
+      # Restore the log first, so that nothing logged while the queue
+      # drains is put behind the sentinel and lost.
+      for level, method in self.methods.items():
+         setattr(self.logger, level, method)
+      delattr(self.logger, ATTRIBUTE)
+
+      self.queue.put(None)
+      self._writer.join()
+      self._writer = None
+
+      for level in LEVELS:
+         if self.dropped[level] or self.sampled[level]:
+            self.logger.Info('Log sink: %d of %d %s messages dropped, %d sampled out',
+                             self.dropped[level], self.seen[level], level,
+                             self.sampled[level])
+      self._flushHandlers()
+
+def _parseSample(value):
+   """ @returns: A dict of level to N for 'Level=N,Level=N' """
+   sample = {}
+   for item in (value or '').split(','):
+      if '=' in item:
+         level, every = item.split('=', 1)
+         try:
+            sample[level.strip().capitalize()] = int(every)
+         except ValueError:
+            pass
+   return sample
+
+def Attach():
+   """
+   Attach a sink to the log if VMWARE_ASYNC_LOG is set and none is
+   attached yet.
+
+   @returns: The attached sink, or None
+   """
+   if not ENV.get('VMWARE_ASYNC_LOG'):
+      return None
+   sink = getattr(log, ATTRIBUTE, None)
+   if sink is None:
+      sink = LogSink(log, _parseSample(ENV.get('VMWARE_LOG_SAMPLE')))
+      sink.Attach()
+   return sink
+
+def Flush():
+   """ Flush the attached sink, if any, at a phase boundary """
+   sink = getattr(log, ATTRIBUTE, None)
+   if sink is not None:
+      sink.Flush()
+
+def Detach():
+   """ Detach the attached sink, if any """
+   sink = getattr(log, ATTRIBUTE, None)
+   if sink is not None:
+      sink.Detach()
@@ -0,0 +1,177 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Read-only queries against the installer database.
+
+Answers which component owns a file, which files a component installed
+and which components are installed, straight from SQLite.  Nothing of the
+installer is loaded: no component scripts, no UI and no transaction
+machinery, so a query costs a Python startup and a few page reads.
+
+The database is opened with query_only set.  If it is in WAL mode, see
+schema.py --wal, queries run alongside an install that holds the write
+lock.  Otherwise they wait up to TIMEOUT seconds for it.
+
+This module only depends on the standard library and schema.py:
+
+   query.py --owner PATH
+   query.py --files COMPONENT
+   query.py --list-components [--json]
+"""
+import optparse
+import os
+import sqlite3
+import sys
+
+from schema import SCHEMA_VERSION, SplitPath
+
+DATABASE = '/etc/vmware-installer/database'
+
+# Seconds to wait for a writer when the database is not in WAL mode.
+TIMEOUT = 5.0
+
+def _connect(database):
+   """
+   Open database with query_only set.  The setting is read back, because
+   SQLite older than 3.8.0 silently ignores it.
+   """
+   conn = sqlite3.connect(str(database), timeout=TIMEOUT)
+   try:
+      conn.execute('PRAGMA query_only = ON')
+      row = conn.execute('PRAGMA query_only').fetchone()
+      if not row or row[0] != 1:
+         raise sqlite3.NotSupportedError('SQLite %s cannot open a database read-only' %
+                                         sqlite3.sqlite_version)
+   except sqlite3.Error:
+      conn.close()
+      raise
+   return conn
+
+class Query(object):
+   def __init__(self, database=DATABASE):
+      self.conn = _connect(database)
+      try:
+         self.interned = self.conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION
+      except sqlite3.Error:
+         self.conn.close()
+         raise
+
+   def Owner(self, fil):
+      """
+      @param fil: A file path, made absolute if it is not
+      @returns: The name of the component owning fil, or None
+      """
+      fil = os.path.normpath(os.path.abspath(fil))
+      if self.interned:
+         # Lookup through the index rather than the files view, which
+         # has to be scanned.
+         row = self.conn.execute('SELECT components.name FROM file_entries '
+                                 'JOIN dirs ON dirs.id = file_entries.dir_id '
+                                 'JOIN components ON components.id = file_entries.component_id '
+                                 'WHERE dirs.path = ? AND file_entries.name = ?',
+                                 SplitPath(fil)).fetchone()
+      else:
+         row = self.conn.execute('SELECT components.name FROM files '
+                                 'JOIN components ON components.id = files.component_id '
+                                 'WHERE files.path = ?', (fil,)).fetchone()
+      return row and row[0] or None
+
+   def Files(self, component):
+      """ @returns: The sorted paths of all files installed by component """
+      rows = self.conn.execute('SELECT files.path FROM files '
+                               'JOIN components ON components.id = files.component_id '
+                               'WHERE components.name = ? ORDER BY files.path',
+                               (component,)).fetchall()
+      return [row[0] for row in rows]
+
+   def Components(self):
+      """
+      @returns: A list of dicts with the name, version, buildNumber and
+                longName of every installed component, sorted by name
+      """
+      rows = self.conn.execute('SELECT name, version, buildNumber, longName '
+                               'FROM components ORDER BY name').fetchall()
+      return [{'name': name, 'version': version, 'buildNumber': buildNumber,
+               'longName': longName}
+              for name, version, buildNumber, longName in rows]
+
+   def Close(self):
+      self.conn.close()
+
+_JSON_ESCAPES = {'"': '\\"', '\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+def _jsonString(value):
+   ret = []
+   for char in unicode(value):
+      if char in _JSON_ESCAPES:
+         ret.append(_JSON_ESCAPES[char])
+      elif ord(char) < 0x20 or ord(char) > 0x7e:
+         ret.append('\\u%04x' % ord(char))
+      else:
+         ret.append(char)
+   return '"%s"' % ''.join(ret)
+
+def ToJSON(value):
+   """
+   Encode strings, numbers, booleans, None, lists and dicts as JSON.
+   The json module is not available in every Python we run under.
+   """
+   if value is None:
+      return 'null'
+   if value is True:
+      return 'true'
+   if value is False:
+      return 'false'
+   if isinstance(value, (int, long, float)):
+      return repr(value)
+   if isinstance(value, basestring):
+      return _jsonString(value)
+   if isinstance(value, dict):
+      return '{%s}' % ', '.join(['%s: %s' % (_jsonString(k), ToJSON(value[k]))
+                                 for k in sorted(value.keys())])
+   return '[%s]' % ', '.join([ToJSON(v) for v in value])
+
+def main(argv):
+   parser = optparse.OptionParser(usage='%prog [options]')
+   parser.add_option('--database', default=DATABASE,
+                     help='Installer database to query.')
+   parser.add_option('--owner', metavar='PATH',
+                     help='Print the component that installed PATH.')
+   parser.add_option('--files', metavar='COMPONENT',
+                     help='Print the files installed by COMPONENT.')
+   parser.add_option('--list-components', action='store_true', default=False,
+                     help='Print the installed components.')
+   parser.add_option('--json', action='store_true', default=False,
+                     help='Print results as JSON.')
+   options, args = parser.parse_args(argv)
+   if len([o for o in (options.owner, options.files, options.list_components) if o]) != 1:
+      parser.error('Exactly one of --owner, --files or --list-components is required')
+
+   try:
+      query = Query(options.database)
+   except sqlite3.Error, e:
+      sys.stderr.write('Unable to open %s: %s\n' % (options.database, e))
+      return 2
+
+   try:
+      if options.owner:
+         result = query.Owner(options.owner)
+         lines = result and [result] or []
+      elif options.files:
+         result = query.Files(options.files)
+         lines = result
+      else:
+         result = query.Components()
+         lines = ['%(name)s\t%(version)s\t%(buildNumber)s' % c for c in result]
+   finally:
+      query.Close()
+
+   if options.json:
+      sys.stdout.write(ToJSON(result) + '\n')
+   else:
+      for line in lines:
+         sys.stdout.write('%s\n' % line)
+   return not result and 1 or 0
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,263 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Component dependency and conflict resolution.
+
+Every dependency and conflict string in the database, such as
+'vmware-vix<1.15.0' or 'Opt:vmware-tools-linux>=10.0.0', is parsed once
+into a Constraint holding an interned version tuple.  A Resolver indexes
+the installed components by name and plans a whole transaction in one
+pass: a topological sort gives the install and uninstall order, and a
+bitset of conflicts per component detects conflicts.  Resolvers and the
+plans they produce are cached against the generation of the database
+file, so planning does not query the tables again until it changes.
+"""
+import os
+import re
+import sqlite3
+
+# Longest operators first so that '>=' is not read as '>'.
+CONSTRAINT_RE = re.compile(r'^(Opt:)?([^<>=!]+?)(>=|<=|!=|=|<|>)?([0-9][0-9.]*)?$')
+
+OPERATORS = {'=': lambda a, b: a == b,
+             '!=': lambda a, b: a != b,
+             '>=': lambda a, b: a >= b,
+             '<=': lambda a, b: a <= b,
+             '>': lambda a, b: a > b,
+             '<': lambda a, b: a < b,
+             None: lambda a, b: True}
+
+_versions = {}
+_constraints = {}
+_resolvers = {}
+
+class ResolverError(Exception):
+   """ Raised for a constraint or version that cannot be parsed, or a dependency cycle """
+   pass
+
+def ParseVersion(version):
+   """ Parse and intern a version string, ie: '12.0.0' -> (12, 0, 0) """
+   # XXX: Same as versions.ParseVersion, which can't be loaded from here.
+   try:
+      return _versions[version]
+   except KeyError:
+      try:
+         parsed = tuple([int(x) for x in version.split('.')])
+      except ValueError:
+         raise ResolverError('Invalid version: %s' % version)
+      _versions[version] = parsed
+      return parsed
+
+class Constraint(object):
+   def __init__(self, text):
+      match = CONSTRAINT_RE.match(text)
+      if not match or bool(match.group(3)) != bool(match.group(4)):
+         raise ResolverError('Invalid constraint: %s' % text)
+      self.text = text
+      self.optional = bool(match.group(1))
+      self.name = match.group(2)
+      self.op = match.group(3)
+      self.version = self.op and ParseVersion(match.group(4)) or None
+      self._test = OPERATORS[self.op]
+
+   def Matches(self, version):
+      """
+      @param version: A version tuple
+      @returns: True if a component of this name at version satisfies us
+      """
+      return self._test(version, self.version)
+
+   def __repr__(self):
+      return 'Constraint(%r)' % self.text
+
+def ParseConstraint(text):
+   """ Returns the Constraint for text, parsing each distinct string once """
+   try:
+      return _constraints[text]
+   except KeyError:
+      constraint = Constraint(text)
+      _constraints[text] = constraint
+      return constraint
+
+class ComponentInfo(object):
+   def __init__(self, name, version, dependencies=(), conflicts=()):
+      self.name = name
+      self.version = ParseVersion(version)
+      self.dependencies = [ParseConstraint(d) for d in dependencies]
+      self.conflicts = [ParseConstraint(c) for c in conflicts]
+
+class Plan(object):
+   """
+   The result of Resolver.Plan().
+
+   @ivar install: Names to install or upgrade, dependencies first
+   @ivar uninstall: Names to uninstall, dependents first
+   @ivar conflicts: (name, name) pairs that conflict in the final set
+   @ivar unsatisfied: (name, Constraint) pairs for required dependencies
+                      that are missing or at the wrong version
+   """
+   def __init__(self, install, uninstall, conflicts, unsatisfied):
+      self.install = install
+      self.uninstall = uninstall
+      self.conflicts = conflicts
+      self.unsatisfied = unsatisfied
+
+   def IsValid(self):
+      return not self.conflicts and not self.unsatisfied
+
+def _generation(database):
+   """
+   Identifies the state of the database; changes on every commit.  In WAL
+   mode commits only touch the -wal file until it is checkpointed, so it
+   is part of the generation too.
+   """
+   st = os.stat(str(database))
+   ret = (st.st_ino, st.st_mtime, st.st_size)
+   try:
+      st = os.stat('%s-wal' % database)
+   except OSError:
+      return ret
+   return ret + (st.st_ino, st.st_mtime, st.st_size)
+
+class Resolver(object):
+   def __init__(self, database):
+      """
+      Load and parse all installed components with their dependencies and
+      conflicts in one read of the database.
+
+      @param database: Path to the installer database
+      """
+      self.installed = {}
+      self._plans = {}
+
+      conn = sqlite3.connect(str(database))
+      try:
+         components = conn.execute('SELECT id, name, version FROM components').fetchall()
+         dependencies = conn.execute('SELECT component_id, dependency '
+                                     'FROM component_dependencies').fetchall()
+         conflicts = conn.execute('SELECT component_id, conflict '
+                                  'FROM component_conflicts').fetchall()
+      finally:
+         conn.close()
+
+      deps = {}
+      for componentId, dependency in dependencies:
+         deps.setdefault(componentId, []).append(dependency)
+      confs = {}
+      for componentId, conflict in conflicts:
+         confs.setdefault(componentId, []).append(conflict)
+
+      for componentId, name, version in components:
+         self.installed[name] = ComponentInfo(name, version,
+                                              deps.get(componentId, ()),
+                                              confs.get(componentId, ()))
+
+   def Plan(self, install=(), uninstall=()):
+      """
+      Plan a transaction against the installed components.
+
+      Upgrades are installs of a component that is already installed.
+      Plans are cached by their arguments.
+
+      @param install: ComponentInfo objects to install or upgrade
+      @param uninstall: Names of components to uninstall
+
+      @returns: A Plan
+      """
+      key = (tuple([(c.name, c.version) for c in install]), tuple(uninstall))
+      if key in self._plans:
+         return self._plans[key]
+
+      final = dict(self.installed)
+      for name in uninstall:
+         final.pop(name, None)
+      for component in install:
+         final[component.name] = component
+
+      order = self._sort(final)
+      rank = dict([(name, i) for i, name in enumerate(order)])
+
+      installNames = dict([(c.name, True) for c in install])
+      installOrder = [name for name in order if name in installNames]
+
+      # Dependents of the removed components go first.
+      removed = [name for name in uninstall if name in self.installed]
+      uninstallOrder = self._sort(dict([(name, self.installed[name]) for name in removed]))
+      uninstallOrder.reverse()
+
+      plan = Plan(installOrder, uninstallOrder,
+                  self._conflicts(final, order, rank),
+                  self._unsatisfied(final, order))
+      self._plans[key] = plan
+      return plan
+
+   def _sort(self, components):
+      """
+      Topologically sort components so that dependencies come first.
+      Dependencies outside of components are ignored.
+      """
+      order = []
+      state = {}
+      for name in sorted(components.keys()):
+         if name in state:
+            continue
+         # Iterative depth first search; state 1 = on the stack, 2 = done.
+         stack = [(name, iter(components[name].dependencies))]
+         state[name] = 1
+         while stack:
+            current, deps = stack[-1]
+            for dep in deps:
+               if dep.name not in components:
+                  continue
+               if state.get(dep.name) == 1:
+                  raise ResolverError('Dependency cycle through %s and %s' %
+                                      (current, dep.name))
+               if dep.name not in state:
+                  state[dep.name] = 1
+                  stack.append((dep.name, iter(components[dep.name].dependencies)))
+                  break
+            else:
+               stack.pop()
+               state[current] = 2
+               order.append(current)
+      return order
+
+   def _conflicts(self, final, order, rank):
+      """ Find conflicting pairs with one bitset of conflicts per component """
+      ret = []
+      for name in order:
+         mask = 0
+         for conflict in final[name].conflicts:
+            other = final.get(conflict.name)
+            if other is not None and other.name != name and conflict.Matches(other.version):
+               mask |= 1 << rank[other.name]
+         i = 0
+         while mask:
+            if mask & 1:
+               ret.append((name, order[i]))
+            mask >>= 1
+            i += 1
+      return ret
+
+   def _unsatisfied(self, final, order):
+      ret = []
+      for name in order:
+         for dep in final[name].dependencies:
+            if dep.optional:
+               continue
+            other = final.get(dep.name)
+            if other is None or not dep.Matches(other.version):
+               ret.append((name, dep))
+      return ret
+
+def GetResolver(database):
+   """
+   Returns a Resolver for database.  It is reused until the database file
+   changes.
+   """
+   generation = _generation(database)
+   cached = _resolvers.get(str(database))
+   if cached is None or cached[0] != generation:
+      cached = (generation, Resolver(database))
+      _resolvers[str(database)] = cached
+   return cached[1]
@@ -0,0 +1,218 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Path-interned storage for the files table.
+
+Every row of the original files table repeats its full directory, such as
+/usr/share/doc/vmware-vix/lang/com/functions/.  Migrate() moves directories
+into a dirs table, each stored once with a trailing slash, and files into
+file_entries as (dir_id, name).  A files view with INSTEAD OF triggers
+puts the original table back together so that existing queries, inserts,
+updates and deletes keep working unchanged.  The database is rebuilt with
+4096 byte pages and auto-vacuum so that space freed by uninstalls is
+returned to the filesystem.
+
+Lookups by path through the view cannot use an index; use SplitPath() and
+query file_entries directly where that matters.
+
+This module only depends on the standard library so it can be run directly
+without loading the installer:
+
+   schema.py [--database DATABASE] [--revert] [--wal]
+"""
+import optparse
+import sqlite3
+import sys
+
+DATABASE = '/etc/vmware-installer/database'
+
+# Stored in PRAGMA user_version once the files table has been migrated.
+SCHEMA_VERSION = 1
+
+PAGE_SIZE = 4096
+AUTO_VACUUM_FULL = 1
+
+# The directory of a path, with its trailing slash, in SQL:  rtrim() strips
+# every character but '/' from the right, up to the last slash.
+_DIRNAME = "rtrim(%(p)s, replace(%(p)s, '/', ''))"
+_BASENAME = "substr(%(p)s, length(" + _DIRNAME + ") + 1)"
+
+def _dirname(p):
+   return _DIRNAME % {'p': p}
+
+def _basename(p):
+   return _BASENAME % {'p': p}
+
+# INSERT OR IGNORE would be turned into INSERT OR REPLACE by an outer
+# INSERT OR REPLACE INTO files, changing the id of the directory.
+_ADD_DIR = 'INSERT INTO dirs(path) SELECT %(d)s ' \
+           'WHERE NOT EXISTS (SELECT 1 FROM dirs WHERE path = %(d)s);'
+
+MIGRATION = [
+   'CREATE TABLE dirs(id INTEGER PRIMARY KEY, '
+                     'path VARCHAR NOT NULL UNIQUE)',
+   'CREATE TABLE file_entries(id INTEGER PRIMARY KEY, '
+                             'dir_id INTEGER NOT NULL, '
+                             'name VARCHAR NOT NULL, '
+                             'mtime INTEGER NOT NULL, '
+                             'type INTEGER NOT NULL, '
+                             'component_id INTEGER, '
+                             'UNIQUE(dir_id, name))',
+   'CREATE INDEX file_entries_component ON file_entries(component_id)',
+   'INSERT INTO dirs(path) SELECT DISTINCT %s FROM files' % _dirname('path'),
+   'INSERT INTO file_entries(id, dir_id, name, mtime, type, component_id) '
+      'SELECT files.id, dirs.id, %s, files.mtime, files.type, files.component_id '
+      'FROM files JOIN dirs ON dirs.path = %s' % (_basename('files.path'),
+                                                  _dirname('files.path')),
+   'DROP TABLE files',
+   'CREATE VIEW files AS '
+      'SELECT file_entries.id AS id, dirs.path || file_entries.name AS path, '
+             'file_entries.mtime AS mtime, file_entries.type AS type, '
+             'file_entries.component_id AS component_id '
+      'FROM file_entries JOIN dirs ON dirs.id = file_entries.dir_id',
+   'CREATE TRIGGER files_insert INSTEAD OF INSERT ON files BEGIN ' +
+      _ADD_DIR % {'d': _dirname('NEW.path')} +
+      'INSERT INTO file_entries(id, dir_id, name, mtime, type, component_id) '
+         'SELECT NEW.id, id, %s, NEW.mtime, NEW.type, NEW.component_id '
+         'FROM dirs WHERE path = %s; ' % (_basename('NEW.path'), _dirname('NEW.path')) +
+   'END',
+   'CREATE TRIGGER files_update INSTEAD OF UPDATE ON files BEGIN ' +
+      _ADD_DIR % {'d': _dirname('NEW.path')} +
+      'UPDATE file_entries SET id = NEW.id, '
+         'dir_id = (SELECT id FROM dirs WHERE path = %s), '
+         'name = %s, mtime = NEW.mtime, type = NEW.type, '
+         'component_id = NEW.component_id '
+         'WHERE id = OLD.id; ' % (_dirname('NEW.path'), _basename('NEW.path')) +
+      'DELETE FROM dirs WHERE path = %s AND NOT EXISTS '
+         '(SELECT 1 FROM file_entries WHERE dir_id = dirs.id); ' % _dirname('OLD.path') +
+   'END',
+   'CREATE TRIGGER files_delete INSTEAD OF DELETE ON files BEGIN '
+      'DELETE FROM file_entries WHERE id = OLD.id; '
+      'DELETE FROM dirs WHERE path = %s AND NOT EXISTS '
+         '(SELECT 1 FROM file_entries WHERE dir_id = dirs.id); ' % _dirname('OLD.path') +
+   'END',
+   'PRAGMA user_version = %d' % SCHEMA_VERSION,
+]
+
+REVERSION = [
+   'CREATE TABLE files_table(id INTEGER PRIMARY KEY, '
+                            'path VARCHAR NOT NULL UNIQUE, '
+                            'mtime INTEGER NOT NULL, '
+                            'type INTEGER NOT NULL, '
+                            'component_id INTEGER)',
+   'INSERT INTO files_table SELECT id, path, mtime, type, component_id FROM files',
+   'DROP VIEW files',
+   'DROP TABLE file_entries',
+   'DROP TABLE dirs',
+   'ALTER TABLE files_table RENAME TO files',
+   'PRAGMA user_version = 0',
+]
+
+def SplitPath(path):
+   """
+   Split a path the way it is stored, ie:
+   '/usr/lib/vmware/bin/vmware' -> ('/usr/lib/vmware/bin/', 'vmware')
+   """
+   i = path.rfind('/') + 1
+   return (path[:i], path[i:])
+
+def IsMigrated(conn):
+   """ @returns: True if the files table of conn is path-interned """
+   return conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION
+
+def _connect(database):
+   conn = sqlite3.connect(str(database))
+   # Transactions are managed explicitly; VACUUM cannot run inside one.
+   conn.isolation_level = None
+   return conn
+
+def _run(conn, statements):
+   conn.execute('BEGIN EXCLUSIVE')
+   try:
+      for statement in statements:
+         conn.execute(statement)
+   except:
+      conn.execute('ROLLBACK')
+      raise
+   conn.execute('COMMIT')
+
+def _rebuild(conn, pageSize, autoVacuum):
+   """ Change the page size and auto-vacuum mode, which takes a VACUUM """
+   conn.execute('PRAGMA page_size = %d' % pageSize)
+   conn.execute('PRAGMA auto_vacuum = %d' % autoVacuum)
+   conn.execute('VACUUM')
+
+def Migrate(database):
+   """
+   Migrate database to path-interned files.  This must not run while an
+   installer transaction holds the database.
+
+   @param database: Path to the installer database
+   @returns: True if the database was migrated, False if it already was
+   """
+   conn = _connect(database)
+   try:
+      if IsMigrated(conn):
+         return False
+      _run(conn, MIGRATION)
+      _rebuild(conn, PAGE_SIZE, AUTO_VACUUM_FULL)
+      return True
+   finally:
+      conn.close()
+
+def Revert(database):
+   """
+   Put the original files table back.
+
+   @param database: Path to the installer database
+   @returns: True if the database was reverted, False if it was not migrated
+   """
+   conn = _connect(database)
+   try:
+      if not IsMigrated(conn):
+         return False
+      _run(conn, REVERSION)
+      conn.execute('VACUUM')
+      return True
+   finally:
+      conn.close()
+
+def EnableWAL(database):
+   """
+   Switch database to write-ahead logging, so that readers such as
+   query.py are not blocked by an installer transaction.  The mode is
+   persistent and needs SQLite 3.7.0 or later in every installer that
+   opens the database.
+
+   @param database: Path to the installer database
+   @returns: True if the database is now in WAL mode
+   """
+   conn = _connect(database)
+   try:
+      return conn.execute('PRAGMA journal_mode = WAL').fetchone()[0] == 'wal'
+   finally:
+      conn.close()
+
+def main(argv):
+   parser = optparse.OptionParser(usage='%prog [options]')
+   parser.add_option('--database', default=DATABASE,
+                     help='Installer database to migrate.')
+   parser.add_option('--revert', action='store_true', default=False,
+                     help='Restore the original files table.')
+   parser.add_option('--wal', action='store_true', default=False,
+                     help='Also switch the database to write-ahead logging.')
+   options, args = parser.parse_args(argv)
+
+   if options.revert:
+      changed = Revert(options.database)
+   else:
+      changed = Migrate(options.database)
+   if not changed:
+      sys.stderr.write('%s is already up to date\n' % options.database)
+   if options.wal and not EnableWAL(options.database):
+      sys.stderr.write('Unable to enable WAL mode for %s\n' % options.database)
+      return 1
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
@@ -7,6 +7,8 @@ from vmis import PRODUCT_NAME, PRODUCT_SUFFIX
 
 DEST = LIBDIR/'vmware-installer/2.1.0'
 CLEANUP = CONFDIR/'.cleanup'
+# Parsed once rather than in every hook that compares against it.
+VMIS_VERSION = Version('2.1.0')
 
 # The 1.0 Installer looks in very specific locations for existing installs
 # (/etc/vmware and /etc/vmware-vix)
@@ -59,6 +61,8 @@ class VMwareInstaller(Installer):
                        level='CUSTOM', default='yes')
 
    def PreTransactionUninstall(self, old, new, upgrade):
+      self.LoadInclude('logsink').Attach()
+
       keepConfig = ENV.get('VMWARE_KEEP_CONFIG')
       keepConfigStored = self.GetConfig('keepConfigOnUninstall')
       askQuestion = True
@@ -79,7 +83,7 @@ class VMwareInstaller(Installer):
       if askQuestion:
          currentVersion = self.GetConfig('currentVersion')
          if currentVersion and \
-            Version(currentVersion) == Version('2.1.0') and \
+            Version(currentVersion) == VMIS_VERSION and \
             not upgrade:
             # If this is the last installer, it's being uninstalled,
             # and we are not upgrading, then query the user if they
@@ -94,6 +98,8 @@ class VMwareInstaller(Installer):
                              secondaryText='Uninstall')
 
    def InitializeInstall(self, old, new, upgrade):
+      self.LoadInclude('logsink').Attach()
+
       bin = DEST/''
       bin.perm = BINARY
 
@@ -124,19 +130,20 @@ class VMwareInstaller(Installer):
 
    def PostInstall(self, old, new, upgrade):
       bin = DEST/''
+      settings = self._settings()
 
       # Store installer information in the database
-      self.SetConfig('%s.vmisloc' % '2.1.0', DEST)
-      self.SetConfig('%s.pyloc'   % '2.1.0', DEST/'python')
-      self.SetConfig('%s.pyver'   % '2.1.0', PYTHON_VERSION)
+      settings.Set('%s.vmisloc' % '2.1.0', DEST)
+      settings.Set('%s.pyloc'   % '2.1.0', DEST/'python')
+      settings.Set('%s.pyver'   % '2.1.0', PYTHON_VERSION)
 
       # Set up installer specific files.  These are shared between installers, so
       # must be laid down carefully. We only want to set up files if there is
       # either no existing installer or we are the latest and greatest.
-      systemVersion = self.GetConfig('currentVersion')
+      systemVersion = settings.Get('currentVersion')
       if systemVersion is None or Version(systemVersion) <= Version(new):
          # Set ourselves as the current version of the installer to use
-         self.SetConfig('currentVersion', '2.1.0')
+         settings.Set('currentVersion', '2.1.0')
 
          # Remove existing symlink to pave the way for the new one.
          try:
@@ -184,7 +191,7 @@ class VMwareInstaller(Installer):
       # so that we can run.  If so, it set a key pointing to what it
       # set the libconf dir to where it is in /tmp which we must
       # change to the installed location.
-      tmpLibconf = self.GetConfig('libconf')
+      tmpLibconf = settings.Get('libconf')
       tmpLibconf and templates.append(tmpLibconf)
 
       for i in replace:
@@ -192,7 +199,9 @@ class VMwareInstaller(Installer):
          for template in templates:
             self.RunCommand('sed', '-e', 's,%s,%s,g' % (template, libconf), '-i', i)
 
-      self.DelConfig('libconf')
+      settings.Delete('libconf')
+      settings.Flush()
+      self.LoadInclude('logsink').Flush()
 
    def _WriteInstallerBootstrapFile(self, installerPresent=True):
       # To mitigate a bug in the older installers, which would attempt to run
@@ -227,18 +236,24 @@ class VMwareInstaller(Installer):
       except OSError:
          log.Debug('%s did not exist.' % CLEANUP)
 
+      self.LoadInclude('logsink').Detach()
+
    def PreUninstall(self, old, new, upgrade):
       # Remove vmware-installer keys
-      self.DelConfig('%s.vmisloc' % '2.1.0')
-      self.DelConfig('%s.pyloc'   % '2.1.0')
-      self.DelConfig('%s.pyver'   % '2.1.0')
+      settings = self._settings()
+      settings.Delete('%s.vmisloc' % '2.1.0')
+      settings.Delete('%s.pyloc'   % '2.1.0')
+      settings.Delete('%s.pyver'   % '2.1.0')
+      settings.Flush()
+      self.LoadInclude('logsink').Flush()
 
    def PostUninstall(self, old, new, upgrade):
-      currentVersion = self.GetConfig('currentVersion')
-      keepConfig = self.GetConfig('keepConfigOnUninstall')
+      settings = self._settings()
+      currentVersion = settings.Get('currentVersion')
+      keepConfig = settings.Get('keepConfigOnUninstall')
       # currentVersion should not be able to be None under normal install and
       # uninstall, but in a rollback scenario it can happen.
-      if currentVersion and Version(currentVersion) == Version('2.1.0'):
+      if currentVersion and Version(currentVersion) == VMIS_VERSION:
          if keepConfig != 'yes':
             # If we are the newest installer, it means we're the last to go.
             # Clean up after ourselves.
@@ -278,7 +293,7 @@ class VMwareInstaller(Installer):
                pass
 
             # Clear our config key
-            self.DelConfig('currentVersion')
+            settings.Delete('currentVersion')
 
             # XXX: SYSCONFDIR/'config' - This file is used by VIX, Player, and
             # WS, so should only be uninstalled when one of those is the last to
@@ -306,7 +321,16 @@ class VMwareInstaller(Installer):
             # The user chose to keep their configuration, but we still need to remove the
             # currentVersion key since there is no current version of the installer installed
             # anymore
-            self.DelConfig('currentVersion')
+            settings.Delete('currentVersion')
 
             # Re-write the bootstrap file
             self._WriteInstallerBootstrapFile(installerPresent=False)
+
+      settings.Flush()
+      self.LoadInclude('logsink').Detach()
+
+   def _settings(self):
+      """ Returns the settings cache shared by this component's hooks """
+      if getattr(self, 'settingsCache', None) is None:
+         self.settingsCache = self.LoadInclude('settings').SettingsCache(self, 'vmware-installer')
+      return self.settingsCache
@@ -0,0 +1,82 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+"""
+# Marks a key that is known not to be set.
+_UNSET = object()
+
+class SettingsCache(object):
+   """
+   A write-back cache in front of the installer's GetConfig, SetConfig and
+   DelConfig.
+
+   Reads are answered from memory after the first lookup of a key.  Writes
+   and deletes are only recorded and are passed on to the installer by
+   Flush(), with repeated writes to a key collapsed into the last one.
+   Hooks flush when they finish, so nothing is written by a hook that
+   fails.
+   """
+   def __init__(self, inst, component):
+      """
+      @param inst: The Installer object whose settings are cached
+      @param component: The name of inst's component
+      """
+      self.inst = inst
+      self.component = component
+      self._values = {}
+      self._dirty = {}
+
+   def _key(self, key, component):
+      if component is None:
+         component = self.component
+      return (component, key)
+
+   def _lookup(self, key, component):
+      """ Ask the installer for a key that is not cached yet """
+      if component == self.component:
+         return self.inst.GetConfig(key)
+      return self.inst.GetConfig(key, component=component)
+
+   def Get(self, key, component=None):
+      """
+      @param key: The setting name
+      @param component: The component owning the setting.  Defaults to
+                        our own component.
+      @returns: The value, or None if it is not set
+      """
+      cacheKey = self._key(key, component)
+      if cacheKey in self._dirty:
+         value = self._dirty[cacheKey]
+      elif cacheKey in self._values:
+         value = self._values[cacheKey]
+      else:
+         value = self._lookup(key, cacheKey[0])
+         if value is None:
+            value = _UNSET
+         self._values[cacheKey] = value
+      if value is _UNSET:
+         return None
+      return value
+
+   def Set(self, key, value, component=None):
+      """ Record a write, applied by Flush() """
+      self._dirty[self._key(key, component)] = value
+
+   def Delete(self, key, component=None):
+      """ Record a delete, applied by Flush() """
+      self._dirty[self._key(key, component)] = _UNSET
+
+   def Flush(self):
+      """ Pass all pending writes and deletes on to the installer """
+      for (component, key), value in self._dirty.items():
+         # Nothing to do for a delete of a key known not to be set.
+         if value is _UNSET and self._values.get((component, key)) is _UNSET:
+            continue
+         kwargs = {}
+         if component != self.component:
+            kwargs['component'] = component
+         if value is _UNSET:
+            self.inst.DelConfig(key, **kwargs)
+         else:
+            self.inst.SetConfig(key, value, **kwargs)
+         self._values[(component, key)] = value
+      self._dirty = {}
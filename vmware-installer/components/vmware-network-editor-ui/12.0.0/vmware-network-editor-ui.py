@@ -15,13 +15,13 @@ class NetworkEditorUI(Installer):
       self.AddTarget('File', 'share/icons/*', DATADIR/'icons')
       self.SetPermission(BINDIR/'*', BINARY)
 
-      if self.GetConfig('installShortcuts', component='vmware-installer') != 'no':
+      if self._settings().Get('installShortcuts', component='vmware-installer') != 'no':
          self.AddTarget('File', 'share/applications/*', DATADIR/'applications')
          self.AddTarget('Link', DATADIR/'applications/vmware-netcfg.desktop',
                         PREFIX/'local/share/applications/vmware-netcfg.desktop')
 
    def PostInstall(self, old, new, upgrade):
-      if self.GetConfig('installShortcuts', component='vmware-installer') != 'no':
+      if self._settings().Get('installShortcuts', component='vmware-installer') != 'no':
          launcher = DATADIR/'applications/vmware-netcfg.desktop'
          binary = BINDIR/'vmware-netcfg'
          self.RunCommand('sed', '-e', 's,@@BINARY@@,%s,g' % binary, '-i', launcher)
@@ -29,3 +29,9 @@ class NetworkEditorUI(Installer):
       updateModule = self.LoadInclude('update')
       updateModule.UpdateIconCache(self, DATADIR)
       updateModule.UpdateMIME(self, DATADIR)
+
+   def _settings(self):
+      """ Returns the settings cache shared by this component's hooks """
+      if getattr(self, 'settingsCache', None) is None:
+         self.settingsCache = self.LoadInclude('settings').SettingsCache(self, 'vmware-network-editor-ui')
+      return self.settingsCache
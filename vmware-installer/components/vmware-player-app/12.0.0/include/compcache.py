@@ -0,0 +1,193 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+A size-bounded, content-addressed cache of downloaded components.
+
+Component files are stored once per SHA-1 under objects/, however many
+component names and versions refer to them.  An index file maps each
+(name, version) to its object and records when it was last used, so a
+lookup never walks the directory.  Trim() evicts the least recently used
+objects until the cache fits its byte budget.
+
+The index is a text file with one line per (name, version):
+
+   sha1 <tab> size <tab> last used <tab> name <tab> version
+"""
+import hashlib
+import os
+import shutil
+import time
+
+CACHE_DIR = '/var/lib/vmware/compcache'
+INDEX = 'index'
+OBJECTS = 'objects'
+# Downloads in progress, kept next to objects/ so that they are renamed
+# into it.
+PARTIAL = '.partial'
+
+# Default byte budget.
+DEFAULT_BUDGET = 1024 * 1024 * 1024
+
+HASH_BLOCK_SIZE = 256 * 1024
+
+class CacheEntry(object):
+   def __init__(self, digest, size, lastUsed, name, version):
+      self.digest = digest
+      self.size = size
+      self.lastUsed = lastUsed
+      self.name = name
+      self.version = version
+
+class ComponentCache(object):
+   def __init__(self, directory=CACHE_DIR, budget=DEFAULT_BUDGET):
+      """
+      @param directory: The cache directory
+      @param budget: Maximum total size of all objects, in bytes
+      """
+      self.directory = path(directory)
+      self.budget = budget
+      self.entries = {}
+      self._dirty = False
+      self._load()
+
+   def _load(self):
+      try:
+         lines = (self.directory/INDEX).lines(retain=False)
+      except (IOError, OSError):
+         return
+      for line in lines:
+         fields = line.split('\t')
+         if len(fields) != 5:
+            continue
+         digest, size, lastUsed, name, version = fields
+         try:
+            entry = CacheEntry(digest, int(size), float(lastUsed), name, version)
+         except ValueError:
+            continue
+         self.entries[(name, version)] = entry
+
+   def Save(self):
+      """ Write the index back if it changed """
+      if not self._dirty:
+         return
+      if not self.directory.exists():
+         self.directory.makedirs()
+      index = self.directory/INDEX
+      tmp = path('%s.tmp' % index)
+      lines = ['%s\t%d\t%.3f\t%s\t%s' % (e.digest, e.size, e.lastUsed, e.name, e.version)
+               for e in self.entries.values()]
+      tmp.write_lines(lines)
+      tmp.rename(index)
+      self._dirty = False
+
+   def _object(self, digest):
+      return self.directory/OBJECTS/digest[:2]/digest
+
+   def _objects(self):
+      """ @returns: A dict of digest to (size, last used) over all entries """
+      objects = {}
+      for entry in self.entries.values():
+         size, lastUsed = objects.get(entry.digest, (entry.size, 0))
+         objects[entry.digest] = (size, max(lastUsed, entry.lastUsed))
+      return objects
+
+   def Size(self):
+      """ @returns: The total size of all objects, each counted once """
+      return sum([size for size, lastUsed in self._objects().values()])
+
+   def Lookup(self, name, version, digest=None):
+      """
+      @param digest: The expected hex SHA-1, if known.  A cached file with
+                     other contents is not returned.
+      @returns: The path to the cached file for name and version, or None
+      """
+      entry = self.entries.get((name, str(version)))
+      if entry is None or (digest is not None and entry.digest != digest.lower()):
+         return None
+      fil = self._object(entry.digest)
+      if not fil.exists():
+         del self.entries[(name, str(version))]
+         self._dirty = True
+         return None
+      entry.lastUsed = time.time()
+      self._dirty = True
+      return fil
+
+   def Add(self, name, version, fileName, digest=None, move=False):
+      """
+      Store fileName as name and version.
+
+      @param digest: The hex SHA-1 of fileName, if already known
+      @param move: Move fileName into the cache instead of copying it
+      @returns: The path to the cached file
+      """
+      if digest is None:
+         sha1 = hashlib.sha1()
+         fd = open(fileName, 'rb')
+         try:
+            block = fd.read(HASH_BLOCK_SIZE)
+            while block:
+               sha1.update(block)
+               block = fd.read(HASH_BLOCK_SIZE)
+         finally:
+            fd.close()
+         digest = sha1.hexdigest()
+
+      fil = self._object(digest)
+      if not fil.exists():
+         if not fil.dirname().exists():
+            fil.dirname().makedirs()
+         tmp = '%s.tmp' % fil
+         if move:
+            shutil.move(str(fileName), tmp)
+         else:
+            shutil.copyfile(str(fileName), tmp)
+         os.rename(tmp, fil)
+      elif move:
+         os.unlink(fileName)
+
+      self.entries[(name, str(version))] = CacheEntry(digest, fil.getsize(), time.time(),
+                                                     name, str(version))
+      self._dirty = True
+      return fil
+
+   def Trim(self, budget=None):
+      """
+      Evict the least recently used objects until the cache fits budget.
+      Only objects in the index are ever removed.  The product keeps its
+      own downloads in the cache directory, and those are left alone.
+
+      @param budget: Bytes to trim to.  Defaults to the cache's budget.
+      @returns: The number of bytes freed
+      """
+      if budget is None:
+         budget = self.budget
+      freed = 0
+
+      objects = self._objects()
+      total = sum([size for size, lastUsed in objects.values()])
+      order = [(lastUsed, digest) for digest, (size, lastUsed) in objects.items()]
+      order.sort()
+      evicted = {}
+      for lastUsed, digest in order:
+         if total <= budget:
+            break
+         size = objects[digest][0]
+         self._object(digest).remove(ignore_errors=True)
+         evicted[digest] = True
+         total -= size
+         freed += size
+
+      if evicted:
+         for key, entry in self.entries.items():
+            if entry.digest in evicted:
+               del self.entries[key]
+         self._dirty = True
+      self.Save()
+      return freed
+
+   def Purge(self):
+      """ Remove the whole cache """
+      self.directory.rmtree(ignore_errors=True)
+      self.entries = {}
+      self._dirty = False
@@ -0,0 +1,309 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Parallel, resumable and verified component downloads.
+
+Components are fetched by a pool of threads.  Each thread keeps its own
+HTTP/1.1 connection to the server open across requests.  Partial files
+are kept under the component's name and version, so an interrupted
+download resumes with a Range request where it stopped.  Every byte is hashed as it is
+written, and a file whose hash does not match is discarded rather than
+handed on.  Verified files are moved into a cache, normally the
+ComponentCache of compcache.py, and files the cache already holds are not
+downloaded again.
+
+This module only depends on the standard library so it can be run
+against a server directly:
+
+   download.py --server URL --catalog PATH --dest DIR
+
+A catalog has one component per line:
+
+   name <tab> version <tab> path on the server <tab> sha1
+"""
+import hashlib
+import httplib
+import optparse
+import os
+import Queue
+import socket
+import sys
+import threading
+import urlparse
+
+# Bytes read from the network at a time.
+BLOCK_SIZE = 64 * 1024
+
+# Attempts per component, reconnecting after network errors.
+RETRIES = 3
+
+TIMEOUT = 60
+
+# Held while the process wide default timeout is changed to connect.
+_timeoutLock = threading.Lock()
+
+class DownloadError(Exception):
+   pass
+
+class HTTPStatusError(DownloadError):
+   """ The server refused the request; retrying will not help """
+   pass
+
+class DownloadItem(object):
+   def __init__(self, name, version, path, sha1):
+      """
+      @param name: Component name
+      @param version: Component version
+      @param path: Path of the file on the server, relative to its URL
+      @param sha1: Expected hex SHA-1 of the file
+      """
+      self.name = name
+      self.version = version
+      self.path = path
+      self.sha1 = sha1.lower()
+
+class Downloader(object):
+   def __init__(self, server, partialDir, threads=4):
+      """
+      @param server: Base URL of the download server
+      @param partialDir: Directory for partial downloads.  It should be on
+                         the same filesystem as the cache.
+      @param threads: Number of concurrent downloads
+      """
+      url = urlparse.urlsplit(server)
+      if url[0] not in ('http', 'https'):
+         raise DownloadError('Unsupported download server: %s' % server)
+      self.scheme = url[0]
+      self.netloc = url[1]
+      self.basePath = url[2].rstrip('/') + '/'
+      self.partialDir = partialDir
+      self.threads = threads
+
+   def _connect(self):
+      if self.scheme == 'https':
+         connClass = httplib.HTTPSConnection
+      else:
+         connClass = httplib.HTTPConnection
+      try:
+         conn = connClass(self.netloc, timeout=TIMEOUT)
+      except TypeError:
+         # httplib has no timeout argument before Python 2.6, so the
+         # connect is bounded by the default timeout instead.
+         conn = connClass(self.netloc)
+         _timeoutLock.acquire()
+         oldTimeout = socket.getdefaulttimeout()
+         socket.setdefaulttimeout(TIMEOUT)
+         try:
+            conn.connect()
+         finally:
+            socket.setdefaulttimeout(oldTimeout)
+            _timeoutLock.release()
+         conn.sock.settimeout(TIMEOUT)
+      else:
+         conn.connect()
+      return conn
+
+   def _partial(self, item):
+      # Not named by SHA-1: items with the same contents would share it.
+      return os.path.join(self.partialDir, '%s-%s.part' % (item.name, item.version))
+
+   def _resume(self, partial):
+      """ @returns: (SHA-1 object over what is already there, its size) """
+      sha1 = hashlib.sha1()
+      size = 0
+      if os.path.exists(partial):
+         fd = open(partial, 'rb')
+         try:
+            block = fd.read(BLOCK_SIZE)
+            while block:
+               sha1.update(block)
+               size += len(block)
+               block = fd.read(BLOCK_SIZE)
+         finally:
+            fd.close()
+      return sha1, size
+
+   def _fetch(self, conn, item):
+      """
+      Fetch item into its partial file over conn.
+
+      @returns: The partial file, verified
+      """
+      partial = self._partial(item)
+      sha1, size = self._resume(partial)
+
+      headers = {}
+      if size:
+         headers['Range'] = 'bytes=%d-' % size
+      conn.request('GET', self.basePath + item.path.lstrip('/'), headers=headers)
+      response = conn.getresponse()
+
+      if response.status == 416 and size:
+         # We already have all of it.
+         response.read()
+      elif response.status in (200, 206):
+         if response.status == 200 and size:
+            # The server ignored the range, so start over.
+            sha1, size = hashlib.sha1(), 0
+         out = open(partial, size and 'ab' or 'wb')
+         try:
+            block = response.read(BLOCK_SIZE)
+            while block:
+               sha1.update(block)
+               out.write(block)
+               block = response.read(BLOCK_SIZE)
+         finally:
+            out.close()
+      else:
+         response.read()
+         raise HTTPStatusError('%s: HTTP %d %s' % (item.path, response.status, response.reason))
+
+      if sha1.hexdigest() != item.sha1:
+         os.unlink(partial)
+         raise DownloadError('%s: SHA-1 mismatch, discarded' % item.path)
+      return partial
+
+   def FetchCatalog(self, catalog):
+      """
+      @param catalog: Path of a catalog on the server
+      @returns: The catalog's DownloadItems
+      """
+      conn = self._connect()
+      try:
+         conn.request('GET', self.basePath + catalog.lstrip('/'))
+         response = conn.getresponse()
+         text = response.read()
+      finally:
+         conn.close()
+      if response.status != 200:
+         raise DownloadError('%s: HTTP %d %s' % (catalog, response.status, response.reason))
+      return ParseCatalog(text)
+
+   def Fetch(self, items, cache):
+      """
+      Download the items that cache does not hold yet and move them into
+      cache.
+
+      @param items: DownloadItems
+      @param cache: An object with Add(name, version, fileName, digest, move)
+                    and Lookup(name, version, digest), such as a
+                    compcache.ComponentCache
+      @returns: A list of (item, error) for every item that failed
+      """
+      items = [i for i in items if not cache.Lookup(i.name, i.version, i.sha1)]
+      if not items:
+         return []
+      if not os.path.isdir(self.partialDir):
+         os.makedirs(self.partialDir)
+
+      work = Queue.Queue()
+      for item in items:
+         work.put(item)
+      failed = []
+      lock = threading.Lock()
+
+      def worker():
+         conn = None
+         try:
+            while True:
+               try:
+                  item = work.get_nowait()
+               except Queue.Empty:
+                  return
+               for attempt in range(RETRIES):
+                  try:
+                     if conn is None:
+                        conn = self._connect()
+                     partial = self._fetch(conn, item)
+                     lock.acquire()
+                     try:
+                        try:
+                           cache.Add(item.name, item.version, partial, item.sha1, move=True)
+                        except (IOError, OSError), e:
+                           # Not a network problem, so don't fetch it again.
+                           failed.append((item, e))
+                     finally:
+                        lock.release()
+                     break
+                  except HTTPStatusError, e:
+                     failed.append((item, e))
+                     break
+                  except DownloadError, e:
+                     # The response was read in full, so the connection
+                     # can still be used.
+                     if attempt == RETRIES - 1:
+                        failed.append((item, e))
+                  except (httplib.HTTPException, socket.error), e:
+                     # Start over on a fresh connection; the partial file
+                     # keeps what was received.
+                     if conn is not None:
+                        conn.close()
+                        conn = None
+                     if attempt == RETRIES - 1:
+                        failed.append((item, e))
+         finally:
+            if conn is not None:
+               conn.close()
+
+      pool = [threading.Thread(target=worker) for i in range(min(self.threads, len(items)))]
+      for t in pool:
+         t.start()
+      for t in pool:
+         t.join()
+      return failed
+
+class DirectoryCache(object):
+   """ Stores downloads as DIR/name-version, for use outside the installer """
+   def __init__(self, directory):
+      self.directory = directory
+
+   def _dest(self, name, version):
+      return os.path.join(self.directory, '%s-%s' % (name, version))
+
+   def Lookup(self, name, version, digest=None):
+      """ Files are only renamed into place once verified """
+      dest = self._dest(name, version)
+      if os.path.exists(dest):
+         return dest
+      return None
+
+   def Add(self, name, version, fileName, digest=None, move=False):
+      dest = self._dest(name, version)
+      os.rename(fileName, dest)
+      return dest
+
+def ParseCatalog(text):
+   """ @returns: A list of DownloadItems for the lines of a catalog """
+   items = []
+   for line in text.splitlines():
+      fields = line.split('\t')
+      if len(fields) == 4:
+         items.append(DownloadItem(*fields))
+   return items
+
+def main(argv):
+   parser = optparse.OptionParser(usage='%prog [options]')
+   parser.add_option('--server', help='Base URL of the download server.')
+   parser.add_option('--catalog', help='Path of the catalog on the server.')
+   parser.add_option('--dest', help='Directory to download to.')
+   parser.add_option('--threads', type='int', default=4,
+                     help='Number of concurrent downloads.')
+   options, args = parser.parse_args(argv)
+   if not (options.server and options.catalog and options.dest):
+      parser.error('--server, --catalog and --dest are required')
+
+   downloader = Downloader(options.server, os.path.join(options.dest, '.partial'),
+                           options.threads)
+   try:
+      items = downloader.FetchCatalog(options.catalog)
+   except (DownloadError, httplib.HTTPException, socket.error), e:
+      sys.stderr.write('Unable to fetch catalog: %s\n' % e)
+      return 1
+
+   failed = downloader.Fetch(items, DirectoryCache(options.dest))
+   for item, error in failed:
+      sys.stderr.write('%s %s: %s\n' % (item.name, item.version, error))
+   return failed and 1 or 0
+
+if __name__ == '__main__':
+   sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,203 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+In-process replacement for killall.
+
+Processes are found with one scan of /proc, matching the requested names
+against the basename of each process's executable and against its
+command name, the way killall does.  Terminate() signals them, waits for
+them to exit up to a deadline and escalates to SIGKILL for the ones that
+do not, so the caller knows everything is gone before it continues.
+
+Where the kernel supports pidfds each process is held by one from the
+scan on, so signals cannot reach an unrelated process that reused the
+pid and exits are waited for with poll() instead of sleeping.
+"""
+import errno
+import os
+import select
+import signal
+import time
+
+try:
+   import ctypes
+   _libc = ctypes.CDLL(None, use_errno=True)
+   _syscall = _libc.syscall
+except (ImportError, OSError, AttributeError, TypeError):
+   _syscall = None
+
+# Same on every architecture since Linux 5.3 (except alpha).
+SYS_PIDFD_SEND_SIGNAL = 424
+SYS_PIDFD_OPEN = 434
+
+# The kernel truncates command names to this many characters.
+COMM_LEN = 15
+
+# Seconds between checks when pidfds are not available.
+POLL_INTERVAL = 0.05
+
+class Process(object):
+   """
+   A process matched by FindProcesses().
+
+   @ivar status: 'running', 'exited' after the signal, 'killed' after
+                 SIGKILL, or 'survived' if it outlived SIGKILL as well
+   """
+   def __init__(self, pid, name):
+      self.pid = pid
+      self.name = name
+      self.status = 'running'
+      self.pidfd = None
+      if _syscall is not None:
+         fd = _syscall(SYS_PIDFD_OPEN, pid, 0)
+         if fd >= 0:
+            self.pidfd = fd
+
+   def Signal(self, sig):
+      """ @returns: False if the process is already gone """
+      try:
+         if self.pidfd is not None:
+            if _syscall(SYS_PIDFD_SEND_SIGNAL, self.pidfd, sig, None, 0) < 0:
+               err = ctypes.get_errno()
+               raise OSError(err, os.strerror(err))
+         else:
+            os.kill(self.pid, sig)
+      except OSError, e:
+         if e.errno == errno.ESRCH:
+            return False
+         raise
+      return True
+
+   def IsAlive(self):
+      if self.pidfd is not None:
+         # A pidfd becomes readable when the process exits.
+         return not select.select([self.pidfd], [], [], 0)[0]
+      try:
+         stat = open('/proc/%d/stat' % self.pid).read()
+      except IOError:
+         return False
+      # An exited process that was not reaped yet is a zombie.
+      return stat[stat.rfind(')') + 2:][:1] != 'Z'
+
+   def Close(self):
+      if self.pidfd is not None:
+         os.close(self.pidfd)
+         self.pidfd = None
+
+   def __repr__(self):
+      return '%s(%d): %s' % (self.name, self.pid, self.status)
+
+def _exeName(pid):
+   try:
+      exe = os.readlink('/proc/%s/exe' % pid)
+   except OSError:
+      return None
+   if exe.endswith(' (deleted)'):
+      exe = exe[:-len(' (deleted)')]
+   return os.path.basename(exe)
+
+def FindProcesses(names):
+   """
+   Scan /proc once for processes named in names.
+
+   @param names: Executable names, as passed to killall
+   @returns: A list of Process objects, not including ourselves
+   """
+   wanted = {}
+   for name in names:
+      wanted[name] = name
+      wanted.setdefault(name[:COMM_LEN], name)
+
+   found = []
+   me = os.getpid()
+   for pid in os.listdir('/proc'):
+      if not pid.isdigit() or int(pid) == me:
+         continue
+      name = _exeName(pid)
+      if name not in wanted:
+         try:
+            name = open('/proc/%s/comm' % pid).read().strip()
+         except IOError:
+            continue
+         if name not in wanted:
+            continue
+      found.append(Process(int(pid), wanted[name]))
+   return found
+
+def _signal(p, sig):
+   """ Signal p, recording it as survived if that is not permitted """
+   try:
+      return p.Signal(sig)
+   except OSError, e:
+      log.Warn('Unable to signal %r: %s' % (p, e))
+      p.status = 'survived'
+      return False
+
+def _wait(procs, deadline):
+   """ Wait until every process exited or the deadline passed """
+   while True:
+      alive = [p for p in procs if p.IsAlive()]
+      remaining = deadline - time.time()
+      if not alive or remaining <= 0:
+         return alive
+      fds = [p.pidfd for p in alive if p.pidfd is not None]
+      if len(fds) == len(alive):
+         select.select(fds, [], [], remaining)
+      else:
+         time.sleep(min(POLL_INTERVAL, remaining))
+
+def SignalProcesses(names, sig):
+   """
+   Send sig to every process named in names without waiting.
+
+   @returns: The list of Process objects that were signalled
+   """
+   procs = FindProcesses(names)
+   try:
+      return [p for p in procs if _signal(p, sig)]
+   finally:
+      for p in procs:
+         p.Close()
+
+def Terminate(names, timeout=5.0, killTimeout=2.0, sig=signal.SIGTERM):
+   """
+   Stop every process named in names and wait for them to exit.
+
+   @param names: Executable names, as passed to killall
+   @param timeout: Seconds to wait after sig before escalating to SIGKILL
+   @param killTimeout: Seconds to wait after SIGKILL
+   @param sig: The signal to send first
+
+   @returns: The list of matched Process objects with their final status
+   """
+   procs = FindProcesses(names)
+   try:
+      signalled = []
+      for p in procs:
+         if _signal(p, sig):
+            signalled.append(p)
+         elif p.status == 'running':
+            p.status = 'exited'
+
+      stubborn = _wait(signalled, time.time() + timeout)
+      for p in signalled:
+         if p not in stubborn:
+            p.status = 'exited'
+      for p in stubborn:
+         if not _signal(p, signal.SIGKILL) and p.status == 'running':
+            p.status = 'exited'
+      stubborn = [p for p in stubborn if p.status == 'running']
+
+      survivors = _wait(stubborn, time.time() + killTimeout)
+      for p in stubborn:
+         if p in survivors:
+            p.status = 'survived'
+         else:
+            p.status = 'killed'
+   finally:
+      for p in procs:
+         p.Close()
+
+   if procs:
+      log.Info('Stopped processes: %s' % ', '.join([repr(p) for p in procs]))
+   return procs
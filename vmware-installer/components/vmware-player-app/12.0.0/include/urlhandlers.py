@@ -0,0 +1,214 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Registration of the vm:// and vms:// URL handlers used for VM streaming.
+
+GConfHandlers writes every key of both handlers with a single
+gconftool-2 --load of a generated entry file, and removes them with a
+single --unload.  The values already in the defaults source are read
+from its XML first, so nothing is run, and gconfd is not signalled, when
+they are already what we want.
+
+XdgHandlers covers desktops without GConf by making our launcher the
+system default for x-scheme-handler/vm and x-scheme-handler/vms in the
+XDG mimeapps.list, which GIO based desktops, including dconf based
+GNOME, consult.
+
+Both backends have the same interface: Configure() and Deconfigure()
+return True if they changed anything.
+"""
+import os
+import signal
+import tempfile
+from xml.dom import minidom
+from xml.sax.saxutils import escape
+
+HANDLERS = ('vm', 'vms')
+HANDLER_DIR = '/desktop/gnome/url-handlers/%s'
+
+GCONF_DEFAULTS_DIR = '/etc/gconf/gconf.xml.defaults'
+
+MIMEAPPS = '/etc/xdg/mimeapps.list'
+MIMEAPPS_SECTION = '[Default Applications]'
+
+class GConfHandlers(object):
+   def __init__(self, inst, gconftool, source, command, sourceDir=GCONF_DEFAULTS_DIR):
+      """
+      @param inst: The Installer object to run commands with.  Its
+                   component must ship the procs include.
+      @param gconftool: Path to gconftool-2
+      @param source: The configuration source to write to
+      @param command: The handler command, ie: '/usr/bin/vmplayer "%s"'
+      @param sourceDir: The directory holding source's XML tree
+      """
+      self.inst = inst
+      self.gconftool = gconftool
+      self.source = source
+      self.command = command
+      self.sourceDir = path(sourceDir)
+
+   def _entries(self):
+      """ @returns: A list of (key, type, value) for one handler """
+      return [('command', 'string', self.command),
+              ('enabled', 'bool', 'true'),
+              ('needs_terminal', 'bool', 'false')]
+
+   def _current(self, handler):
+      """
+      Read the values stored for a handler straight from the source's XML.
+
+      @returns: A dict of key to (type, value), or None if it cannot be read
+      """
+      fil = self.sourceDir/(HANDLER_DIR % handler).lstrip('/')/'%gconf.xml'
+      if not fil.exists():
+         return {}
+      try:
+         dom = minidom.parse(str(fil))
+      except Exception, e:
+         log.Debug('Unable to read %s: %s' % (fil, e))
+         return None
+
+      values = {}
+      for entry in dom.getElementsByTagName('entry'):
+         gconfType = entry.getAttribute('type')
+         if gconfType == 'string':
+            nodes = entry.getElementsByTagName('stringvalue')
+            value = nodes and ''.join([n.data for n in nodes[0].childNodes
+                                       if n.nodeType == n.TEXT_NODE]) or ''
+         else:
+            value = entry.getAttribute('value')
+         values[entry.getAttribute('name')] = (gconfType, value)
+      return values
+
+   def _run(self, action, entries):
+      """ Run gconftool-2 action on an entry file holding entries """
+      fd, entryFile = tempfile.mkstemp(suffix='.xml')
+      try:
+         out = ['<?xml version="1.0"?>', '<gconfentryfile>']
+         for handler, values in entries:
+            out.append('  <entrylist base="%s">' % escape(HANDLER_DIR % handler))
+            for key, gconfType, value in values:
+               out.append('    <entry><key>%s</key><value><%s>%s</%s></value></entry>' %
+                          (escape(key), gconfType, escape(value), gconfType))
+            out.append('  </entrylist>')
+         out.append('</gconfentryfile>')
+         os.write(fd, '\n'.join(out) + '\n')
+         os.close(fd)
+         fd = None
+         self.inst.RunCommand(self.gconftool, '--direct', '--config-source', self.source,
+                              action, entryFile)
+      finally:
+         if fd is not None:
+            os.close(fd)
+         os.unlink(entryFile)
+
+      # Instruct all gconfd daemons to reload.
+      self.inst.LoadInclude('procs').SignalProcesses(['gconfd-2'], signal.SIGHUP)
+
+   def Configure(self):
+      """
+      Point both handlers at our command.
+
+      @returns: True if anything was changed
+      """
+      wanted = self._entries()
+      changed = []
+      for handler in HANDLERS:
+         current = self._current(handler)
+         if current is None or [e for e in wanted if current.get(e[0]) != e[1:]]:
+            changed.append((handler, wanted))
+      if not changed:
+         log.Info('URL handlers are already configured')
+         return False
+      self._run('--load', changed)
+      return True
+
+   def Deconfigure(self):
+      """
+      Remove both handlers.
+
+      @returns: True if anything was changed
+      """
+      entries = self._entries()
+      present = []
+      for handler in HANDLERS:
+         current = self._current(handler)
+         if current is None or [e for e in entries if e[0] in current]:
+            present.append((handler, entries))
+      if not present:
+         return False
+      self._run('--unload', present)
+      return True
+
+class XdgHandlers(object):
+   def __init__(self, desktopFile, mimeapps=MIMEAPPS):
+      """
+      @param desktopFile: Name of our launcher, ie: 'vmware-player.desktop'
+      @param mimeapps: The mimeapps.list holding the system defaults
+      """
+      self.desktopFile = desktopFile
+      self.mimeapps = path(mimeapps)
+
+   def _read(self):
+      try:
+         return self.mimeapps.lines(retain=False)
+      except (IOError, OSError):
+         return []
+
+   def _write(self, lines):
+      if not self.mimeapps.dirname().exists():
+         self.mimeapps.dirname().makedirs()
+      self.mimeapps.write_lines(lines)
+
+   def _keys(self):
+      return ['x-scheme-handler/%s' % handler for handler in HANDLERS]
+
+   def Configure(self):
+      """
+      Make our launcher the default for both handlers.
+
+      @returns: True if anything was changed
+      """
+      lines = self._read()
+      wanted = dict([(key, '%s=%s' % (key, self.desktopFile)) for key in self._keys()])
+      if MIMEAPPS_SECTION not in lines:
+         lines.append(MIMEAPPS_SECTION)
+
+      changed = False
+      inSection = False
+      for i in range(len(lines)):
+         line = lines[i]
+         if line.startswith('['):
+            inSection = line == MIMEAPPS_SECTION
+         elif inSection and '=' in line:
+            key = line.split('=', 1)[0].strip()
+            if key in wanted:
+               if line != wanted[key]:
+                  lines[i] = wanted[key]
+                  changed = True
+               del wanted[key]
+
+      if wanted:
+         i = lines.index(MIMEAPPS_SECTION) + 1
+         for key in self._keys():
+            if key in wanted:
+               lines.insert(i, wanted[key])
+               i += 1
+         changed = True
+      if changed:
+         self._write(lines)
+      return changed
+
+   def Deconfigure(self):
+      """
+      Remove the defaults that point at our launcher.
+
+      @returns: True if anything was changed
+      """
+      lines = self._read()
+      ours = ['%s=%s' % (key, self.desktopFile) for key in self._keys()]
+      remaining = [line for line in lines if line not in ours]
+      if len(remaining) == len(lines):
+         return False
+      self._write(remaining)
+      return True
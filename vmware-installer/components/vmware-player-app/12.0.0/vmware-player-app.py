@@ -65,7 +65,7 @@ class PlayerApp(Installer):
       for d in [ 'desktop-directories', 'icons', 'mime']:
          self.AddTarget('File', 'share/%s/*' % d, DATADIR/d)
 
-      if self.GetConfig('installShortcuts', component='vmware-installer') != 'no':
+      if self._settings().Get('installShortcuts', component='vmware-installer') != 'no':
          self.AddTarget('File', 'share/applications/*', DATADIR/'applications')
          self.AddTarget('File', 'share/appdata/*', DATADIR/'appdata')
 
@@ -121,7 +121,7 @@ class PlayerApp(Installer):
       # Some linux distributions use yet another standard for DE metadata, requiring
       # .appdata.xml files in order for WS to be usable via the DE app launcher.
       # Like the .desktop files, just install them along with the rest for futureproofing.
-      if self.GetConfig('installShortcuts', component='vmware-installer') != 'no':
+      if self._settings().Get('installShortcuts', component='vmware-installer') != 'no':
          self.AddTarget('Link', DATADIR/'applications/vmware-player.desktop',
                         PREFIX/'local/share/applications/vmware-player.desktop')
          self.AddTarget('Link', DATADIR/'appdata/vmware-player.appdata.xml',
@@ -135,6 +135,12 @@ class PlayerApp(Installer):
       # but it's not yet implemented.
       not themeIndex.exists() and self.AddTarget('File', 'files/index.theme', themeIndex)
 
+   def _settings(self):
+      """ Returns the settings cache shared by this component's hooks """
+      if getattr(self, 'settingsCache', None) is None:
+         self.settingsCache = self.LoadInclude('settings').SettingsCache(self, 'vmware-player-app')
+      return self.settingsCache
+
    def _scriptRunnable(self, script):
       """ Returns True if the script exists and is in a runnable state """
       return script.isexe() and script.isfile() and self.RunCommand(script, 'validate').retCode == 100
@@ -168,16 +174,19 @@ class PlayerApp(Installer):
          log.Info('vmware-mount did not exist or was unable to be run')
 
    def _killVMwareProcesses(self, upgrade):
-      self.RunCommand('killall',
-                      'vmplayer', 'vmware', 'vmware-tray', 'vmware-unity-helper',
-                      'vmware-enter-serial',
-                      'vmnet-natd', 'vmnet-dhcpd',
-                      'vmware-netcfg', 'vmnet-netifup', 'vmnet-bridge',
-                      ignoreErrors=True, noLogging=True);
+      names = ['vmplayer', 'vmware', 'vmware-tray', 'vmware-unity-helper',
+               'vmware-enter-serial',
+               'vmnet-natd', 'vmnet-dhcpd',
+               'vmware-netcfg', 'vmnet-netifup', 'vmnet-bridge']
       # Don't kill fuseUI so we can keep the virtual disk mounted for upgrade.
       if not upgrade:
-         self.RunCommand('killall', 'vmware-fuseUI',
-                         ignoreErrors=True, noLogging=True);
+         names.append('vmware-fuseUI')
+      # Wait for them to exit so that nothing holds our libraries open
+      # while they are replaced.
+      survivors = [p for p in self.LoadInclude('procs').Terminate(names)
+                   if p.status == 'survived']
+      if survivors:
+         log.Warn('Unable to stop %s' % ', '.join([repr(p) for p in survivors]))
 
 
    def PreInstall(self, old, new, upgrade):
@@ -201,7 +210,7 @@ class PlayerApp(Installer):
    def PostUninstall(self, old, new, upgrade):
       VMNETS = 255
 
-      keepConfig = self.GetConfig('keepConfigOnUninstall', component='vmware-installer')
+      keepConfig = self._settings().Get('keepConfigOnUninstall', component='vmware-installer')
       if not upgrade and keepConfig != 'yes':
          (ETCDIR/'networking').remove(ignore_errors=True)
 
@@ -230,14 +239,16 @@ class PlayerApp(Installer):
 
       # only set the value in the config file when it has changed or wasn't there before:
       softwareUpdateEnabled = self.GetConfigValue('installerDefaults.autoSoftwareUpdateEnabled')
-      if softwareUpdateEnabled == None or softwareUpdateEnabled != self.GetAnswer('softwareUpdateEnabled'):
-         SETTINGS['installerDefaults.autoSoftwareUpdateEnabled'] = self.GetAnswer('softwareUpdateEnabled')
+      answer = self.GetAnswer('softwareUpdateEnabled')
+      if softwareUpdateEnabled == None or softwareUpdateEnabled != answer:
+         SETTINGS['installerDefaults.autoSoftwareUpdateEnabled'] = answer
          SETTINGS['installerDefaults.autoSoftwareUpdateEnabled.epoch'] = '%s' % self.randomNumber()
 
       # only set the value in the config file when it has changed or wasn't there before:
       dataCollectionEnabled = self.GetConfigValue('installerDefaults.dataCollectionEnabled')
-      if dataCollectionEnabled == None or dataCollectionEnabled != self.GetAnswer('dataCollectionEnabled'):
-         SETTINGS['installerDefaults.dataCollectionEnabled'] = self.GetAnswer('dataCollectionEnabled')
+      answer = self.GetAnswer('dataCollectionEnabled')
+      if dataCollectionEnabled == None or dataCollectionEnabled != answer:
+         SETTINGS['installerDefaults.dataCollectionEnabled'] = answer
          SETTINGS['installerDefaults.dataCollectionEnabled.epoch'] = '%s' % self.randomNumber()
 
       SETTINGS['installerDefaults.simplifiedUI'] = self.GetAnswer('simplifiedUI')
@@ -296,6 +307,32 @@ class PlayerApp(Installer):
       # Add link to deprecated uninstall mechanism to catch downgrades
       self.AddUninstallLinks()
 
+      # Optionally fill the component cache now rather than on first use.
+      catalog = ENV.get('VMWARE_PREFETCH_COMPONENTS')
+      if catalog and SETTINGS['componentDownload.server']:
+         self._prefetchComponents(SETTINGS['componentDownload.server'], catalog)
+
+   def _prefetchComponents(self, server, catalog):
+      """
+      Download the components listed in a catalog on server into the
+      component cache.  Failures are not fatal; the components are then
+      downloaded when they are first needed.
+      """
+      download = self.LoadInclude('download')
+      compcache = self.LoadInclude('compcache')
+      cache = compcache.ComponentCache()
+      downloader = download.Downloader(server, cache.directory/compcache.PARTIAL)
+      try:
+         items = downloader.FetchCatalog(catalog)
+         failed = downloader.Fetch(items, cache)
+      except Exception, e:
+         log.Warn('Unable to prefetch components: %s' % e)
+         return
+      finally:
+         cache.Save()
+      for item, error in failed:
+         log.Warn('Unable to prefetch %s %s: %s' % (item.name, item.version, error))
+
    def _AddLineToFile(self, fil, text, addToEnd=True):
       """
       Add a line/consecutive lines to a file, surrounded by the VMware Sentinel.
@@ -392,50 +429,33 @@ class PlayerApp(Installer):
       else:
          log.Info('Prelink not present, skipping configuration.')
 
-   def _isGConfUsable(self):
-      """ Return True if GConf settings can be configured, otherwise False """
-      return self.RunCommand('gconftool-2', '--help', ignoreErrors=True, noLogging=True).retCode == 0
+   def _urlHandlers(self):
+      """
+      Returns the backend for the vm:// and vms:// handlers used for VM
+      streaming: GConf if gconftool-2 is available, otherwise the XDG
+      MIME defaults.
+      """
+      urlhandlers = self.LoadInclude('urlhandlers')
+      # If Player isn't being installed as a product then
+      # Workstation must be.
+      if self.isProduct:
+         target, desktopFile = BINDIR/'vmplayer', 'vmware-player.desktop'
+      else:
+         target, desktopFile = BINDIR/'vmware', 'vmware-workstation.desktop'
+
+      gconftool = self._which('gconftool-2')
+      if gconftool:
+         return urlhandlers.GConfHandlers(self, gconftool, GCONF_DEFAULTS,
+                                          '%s "%%s"' % self._escape(target))
+      return urlhandlers.XdgHandlers(desktopFile)
 
    def _configureVMStreamingHandlers(self):
       """ Configures handlers for vm:// and vms:// used for VM streaming """
-      def configureGConf():
-         # If Player isn't being installed as a product then
-         # Workstation must be.
-         if self.isProduct:
-            target = BINDIR/'vmplayer'
-         else:
-            target = BINDIR/'vmware'
-
-         target = self._escape(target)
-
-         settings = (
-            ('string', '/desktop/gnome/url-handlers/%s/command', '%s "%%s"' % target),
-            ('bool', '/desktop/gnome/url-handlers/%s/enabled', 'true'),
-            ('bool', '/desktop/gnome/url-handlers/%s/needs_terminal', 'false'),
-         )
-
-         for handler in ('vm', 'vms'):
-            for gconfType, key, value in settings:
-               key = key % handler
-               self.RunCommand('gconftool-2', '--direct', '--config-source', GCONF_DEFAULTS,
-                               '--type', gconfType, '--set', key, value)
-
-         # Instruct all gconfd daemons to reload.
-         self.RunCommand('killall', '-HUP', 'gconfd-2')
-
-      self._isGConfUsable() and configureGConf()
+      self._urlHandlers().Configure()
 
    def _deconfigureVMStreamingHandlers(self):
       """ Deconfigures the handlers for vm:// and vms:// used for VM streaming"""
-      def deconfigureGConf():
-         for handler in ('vm', 'vms'):
-            self.RunCommand('gconftool-2', '--direct', '--config-source', GCONF_DEFAULTS,
-                            '--recursive-unset', '/desktop/gnome/url-handlers/%s' % handler)
-
-         # Instruct all gconfd daemons to reload.
-         self.RunCommand('killall', '-HUP', 'gconfd-2')
-
-      self._isGConfUsable() and deconfigureGConf()
+      self._urlHandlers().Deconfigure()
 
    def _escape(self, string):
       """ Escapes a string for use in a shell context """
@@ -457,6 +477,14 @@ class PlayerApp(Installer):
       links = [BINDIR/uninstaller,
                SYSCONFDIR/('vmware%s/installer.sh' % extension)]
 
+      bin = LIBDIR/'vmware-installer/@@VMIS_VERSION@@'
+      bin.perm = BINARY
+      try:
+         BINDIR.makedirs()
+      except OSError:
+         # It's okay if it already exists.
+         pass
+
       # Remove the old file/links
       for link in links:
          try:
@@ -467,14 +495,6 @@ class PlayerApp(Installer):
 
          # Create installer hooks.  symlink expects a string and can't convert
          # a ComponentDestination object.  Convert them manually.
-         try:
-            BINDIR.makedirs()
-         except OSError:
-            # It's okay if it already exists.
-            pass
-
-         bin = LIBDIR/'vmware-installer/@@VMIS_VERSION@@'
-         bin.perm = BINARY
          path(bin/'vmware-uninstall-downgrade').symlink(str(link))
 
       locationsFile = SYSCONFDIR/('vmware%s/locations' % extension)
@@ -2,6 +2,26 @@
 Copyright 2012 VMware, Inc.  All rights reserved. -- VMware Confidential
 """
 
+# Parsed versions, keyed by version string.  Versions are compared many
+# times over a transaction but there are only a handful of distinct ones.
+_parsed = {}
+
+def ParseVersion(version):
+   """
+   Parse a version string into a tuple of integers.  Results are cached,
+   so each distinct string is only split and parsed once.
+
+   @param version: The version string, ie: 12.0.0
+
+   @returns: The version as a tuple, ie: (12, 0, 0)
+   """
+   try:
+      return _parsed[version]
+   except KeyError:
+      parsed = tuple([int(x) for x in version.split('.')])
+      _parsed[version] = parsed
+      return parsed
+
 def CompareVersionString(version0, version1):
    """
    Compare two version strings
@@ -13,8 +33,4 @@ def CompareVersionString(version0, version1):
    @returns:  0 if version0 = version1
    @returns:  1 if version0 > version1
    """
-   v0 = version0.split('.')
-   v1 = version1.split('.')
-   v0 = [int(x) for x in v0]
-   v1 = [int(x) for x in v1]
-   return cmp(v0, v1)
+   return cmp(ParseVersion(version0), ParseVersion(version1))
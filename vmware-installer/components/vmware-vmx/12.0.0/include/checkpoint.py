@@ -0,0 +1,81 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Per-component phase checkpoints for resuming an interrupted transaction.
+
+The installer database is locked and rolled back along with the
+transaction, so checkpoints are kept in a small file beside it instead.
+A checkpoint is keyed by component, version and build number, and only
+counts when the same build is run again with VMWARE_RESUME_TRANSACTION
+set.  Any other transaction clears the component's checkpoints first.
+
+Only phases whose results outlive the rest of the transaction are worth
+a checkpoint.  Whatever lives under the component's own files is laid
+down again on the next run, so phases that edit those files always run.
+"""
+import os
+
+CHECKPOINTS = CONFDIR/'.checkpoints'
+
+def Resuming():
+   """ @returns: True if the user asked to resume an interrupted transaction """
+   return bool(ENV.get('VMWARE_RESUME_TRANSACTION'))
+
+class Checkpoints(object):
+   def __init__(self, component, version, build, fil=CHECKPOINTS):
+      """
+      @param component: Name of the component the checkpoints belong to
+      @param version: The version being installed
+      @param build: The build number being installed
+      @param fil: The checkpoint file shared by all components
+      """
+      self.component = component
+      self.version = str(version)
+      self.build = str(build)
+      self.fil = path(fil)
+
+   def _load(self):
+      """ @returns: A list of (component, version, build, phase) tuples """
+      try:
+         lines = self.fil.lines(retain=False)
+      except (IOError, OSError):
+         return []
+      return [tuple(line.split('\t')) for line in lines if line.count('\t') == 3]
+
+   def _save(self, entries):
+      if not entries:
+         self.fil.remove(ignore_errors=True)
+         return
+      # Written aside and renamed, so a crash leaves the old or the new file.
+      tmp = path('%s.tmp' % self.fil)
+      fd = open(tmp, 'w')
+      try:
+         for entry in entries:
+            fd.write('\t'.join(entry) + '\n')
+         fd.flush()
+         os.fsync(fd.fileno())
+      finally:
+         fd.close()
+      tmp.rename(self.fil)
+
+   def Done(self, phase):
+      """
+      @param phase: The phase name, ie: 'modules:4.2.0-16-generic'
+      @returns: True if resuming and this build already completed phase
+      """
+      if not Resuming():
+         return False
+      return (self.component, self.version, self.build, phase) in self._load()
+
+   def Mark(self, phase):
+      """ Record that this build completed phase """
+      entries = [e for e in self._load() if e[0] != self.component or e[3] != phase]
+      entries.append((self.component, self.version, self.build, phase))
+      self._save(entries)
+
+   def Clear(self):
+      """ Forget this component's checkpoints """
+      entries = self._load()
+      remaining = [e for e in entries if e[0] != self.component]
+      if len(remaining) != len(entries):
+         self._save(remaining)
@@ -0,0 +1,123 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+"""
+
+# DMI strings identifying the hypervisor we are running under.  Checked
+# in order against sys_vendor, product_name and bios_vendor.
+DMI_HYPERVISORS = (('VMware', 'vmware'),
+                   ('QEMU', 'kvm'),
+                   ('KVM', 'kvm'),
+                   ('Xen', 'xen'),
+                   ('innotek', 'virtualbox'),
+                   ('VirtualBox', 'virtualbox'),
+                   ('Virtual Machine', 'hyperv'),
+                   ('Parallels', 'parallels'))
+
+_cached = None
+
+class HostCapabilities(object):
+   """
+   A snapshot of the CPU and virtualization features of this host.
+
+   Everything is probed once, in process, when the object is created.
+   Use GetHostCapabilities() to share one snapshot across a transaction.
+   """
+   def __init__(self, cpuInfo='/proc/cpuinfo', dmiDir='/sys/class/dmi/id'):
+      self.cpuFlags, self.uniformFlags = self._readCPUFlags(cpuInfo)
+      self.dmi = self._readDMI(dmiDir)
+      self.hypervisor = self._detectHypervisor()
+
+      xenTest = path('/proc/xen/capabilities')
+      self.xen = bool(xenTest.exists() and len(xenTest.bytes()))
+      self.kvm = path('/dev/kvm').exists()
+
+   def _readCPUFlags(self, cpuInfo):
+      """
+      Parse the flags of every CPU in cpuInfo.
+
+      All CPUs almost always report an identical flags line, so only the
+      first one is split.  Every other line is compared by hash and only
+      parsed if it differs.
+
+      @returns: A tuple of (flags present on every CPU, True if all CPUs
+                report the same flags).  The flags are None if no flags
+                line was found.
+      """
+      try:
+         fil = open(cpuInfo, 'r')
+      except IOError:
+         raise Exception('Could not open %s' % cpuInfo)
+
+      lines = {}
+      try:
+         for line in fil:
+            if line.startswith('flags'):
+               lines[line] = True
+      finally:
+         fil.close()
+
+      if not lines:
+         return (None, True)
+
+      flags = None
+      for line in lines:
+         cpuFlags = frozenset(line.split(':', 1)[-1].split())
+         if flags is None:
+            flags = cpuFlags
+         else:
+            flags = flags & cpuFlags
+      return (flags, len(lines) == 1)
+
+   def _readDMI(self, dmiDir):
+      """ Read the DMI identification strings, missing ones are '' """
+      dmi = {}
+      for key in ('sys_vendor', 'product_name', 'bios_vendor'):
+         fil = path(dmiDir)/key
+         try:
+            dmi[key] = fil.bytes().strip()
+         except (IOError, OSError):
+            dmi[key] = ''
+      return dmi
+
+   def _detectHypervisor(self):
+      """
+      Name the hypervisor we are running under from DMI data.
+
+      @returns: The hypervisor name, None on real hardware, or '' if a
+                hypervisor is present but cannot be identified.
+      """
+      for key in ('sys_vendor', 'product_name', 'bios_vendor'):
+         for needle, name in DMI_HYPERVISORS:
+            if needle in self.dmi[key]:
+               return name
+
+      # The kernel exposes the CPUID hypervisor-present bit as a flag.
+      if self.cpuFlags and 'hypervisor' in self.cpuFlags:
+         return ''
+      return None
+
+   def HasCPUFlags(self, reqFlags):
+      """
+      @param reqFlags: A list of the flags that must be present.
+      @returns: True if every CPU has all of reqFlags, False otherwise.
+      """
+      return self.cpuFlags is not None and self.cpuFlags.issuperset(reqFlags)
+
+   def InVMwareVM(self):
+      """
+      @returns: True inside a VMware virtual machine, False if not, and
+                None if some hypervisor is present but DMI data is
+                unavailable to tell which one.
+      """
+      if self.hypervisor == 'vmware':
+         return True
+      if self.hypervisor == '' and not self.dmi['sys_vendor']:
+         return None
+      return False
+
+def GetHostCapabilities():
+   """ Returns the HostCapabilities snapshot, probing the host the first time """
+   global _cached
+   if _cached is None:
+      _cached = HostCapabilities()
+   return _cached
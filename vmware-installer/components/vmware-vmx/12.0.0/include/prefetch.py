@@ -0,0 +1,36 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+"""
+import sys
+import threading
+
+class Deferred(object):
+   """
+   Runs a probe in a background thread as soon as it is created.  The
+   result is only waited for when Result() is first called, so slow probes
+   overlap with whatever the installer does in between.
+   """
+   def __init__(self, func, *args, **kwargs):
+      self._result = None
+      self._excInfo = None
+      self._thread = threading.Thread(target=self._run, args=(func, args, kwargs))
+      self._thread.setDaemon(True)
+      self._thread.start()
+
+   def _run(self, func, args, kwargs):
+      try:
+         self._result = func(*args, **kwargs)
+      except Exception:
+         self._excInfo = sys.exc_info()
+
+   def Result(self):
+      """
+      Wait for the probe to finish.
+
+      @returns: The probe's return value.  If the probe raised, the same
+                exception is raised here.
+      """
+      self._thread.join()
+      if self._excInfo:
+         raise self._excInfo[0], self._excInfo[1], self._excInfo[2]
+      return self._result
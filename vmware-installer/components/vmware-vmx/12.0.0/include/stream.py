@@ -0,0 +1,107 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+Running commands whose output is too large to hold.
+
+RunCommand returns everything a command wrote, which for a kernel module
+build can be megabytes.  RunStreaming reads stdout and stderr as they
+are written, hands every line to a callback and keeps only the last
+lines of each, so memory use is bounded however much is written.
+"""
+import errno
+import os
+import select
+import subprocess
+
+# Lines kept of each of stdout and stderr.
+TAIL_LINES = 200
+# Longer lines are cut, so one runaway line cannot grow without bound.
+MAX_LINE = 4096
+
+READ_SIZE = 64 * 1024
+
+class StreamResult(object):
+   """
+   The outcome of RunStreaming.  Like RunCommand's result, but stdout and
+   stderr only hold the tail of the output.
+   """
+   def __init__(self, retCode, stdoutTail, stderrTail):
+      self.retCode = retCode
+      self.stdoutTail = stdoutTail
+      self.stderrTail = stderrTail
+      self.stdout = '\n'.join(stdoutTail)
+      self.stderr = '\n'.join(stderrTail)
+
+class _Stream(object):
+   """ Splits one pipe's output into lines, keeping a tail of them """
+   def __init__(self, name, callback, tailLines):
+      self.name = name
+      self.callback = callback
+      self.tailLines = tailLines
+      self.tail = []
+      self.partial = ''
+
+   def _line(self, line):
+      self.tail.append(line)
+      if len(self.tail) > self.tailLines:
+         del self.tail[0]
+      if self.callback:
+         self.callback(self.name, line)
+
+   def Feed(self, data):
+      lines = (self.partial + data).split('\n')
+      self.partial = lines.pop()
+      for line in lines:
+         self._line(line[:MAX_LINE])
+      if len(self.partial) > MAX_LINE:
+         self._line(self.partial[:MAX_LINE])
+         self.partial = ''
+
+   def Close(self):
+      if self.partial:
+         self._line(self.partial)
+         self.partial = ''
+
+def RunStreaming(command, args, callback=None, tailLines=TAIL_LINES):
+   """
+   Run a command, streaming its output.
+
+   @param command: The program to run
+   @param args: Its arguments
+   @param callback: Called as callback(stream, line) for every line
+                    written, where stream is 'stdout' or 'stderr'
+   @param tailLines: Lines of each stream to keep for the result
+   @returns: A StreamResult
+   @raises OSError: If the command cannot be run
+   """
+   argv = [str(command)] + [str(a) for a in args]
+   log.Info('Running %s' % ' '.join(argv))
+   devnull = open(os.devnull, 'r')
+   try:
+      proc = subprocess.Popen(argv, stdin=devnull, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, close_fds=True)
+   finally:
+      devnull.close()
+
+   out = _Stream('stdout', callback, tailLines)
+   err = _Stream('stderr', callback, tailLines)
+   streams = {proc.stdout.fileno(): out, proc.stderr.fileno(): err}
+   pending = streams.keys()
+   while pending:
+      try:
+         ready = select.select(pending, [], [])[0]
+      except select.error, e:
+         if e.args[0] == errno.EINTR:
+            continue
+         raise
+      for fd in ready:
+         data = os.read(fd, READ_SIZE)
+         if data:
+            streams[fd].Feed(data)
+         else:
+            streams[fd].Close()
+            pending.remove(fd)
+
+   proc.stdout.close()
+   proc.stderr.close()
+   return StreamResult(proc.wait(), out.tail, err.tail)
@@ -3,6 +3,8 @@ Copyright 2008 VMware, Inc.  All rights reserved. -- VMware Confidential
 
 VMware Player App component installer.
 """
+import os
+import subprocess
 
 GCONF_DEFAULTS = 'xml:readwrite:/etc/gconf/gconf.xml.defaults'
 DEST = LIBDIR/'vmware'
@@ -30,18 +32,17 @@ ETCDIR = Destination('/etc/vmware')
 
 class VMX(Installer):
    def InitializeQuestions(self, old, new, upgrade):
+      # Probe the host while the questions are asked and the other
+      # components run their hooks.  Nothing waits for the probes until a
+      # check needs their results.
+      self._startProbes()
+
       self.AddQuestion('ClosePrograms', key='ClosePrograms', text='',
                        required=True, default='Yes', level='REQUIRED')
 
       # Check whether we're in a VM or on real hardware.  If we're in a VM, verify that the
       # proper version of Tools is already installed.
       self.inVM = False
-      self.checkVMBytes = self.GetFileText('extra/checkvm')
-      # Get the directory above our installer and write checkvm to it so we can run it
-      tmpdir = path(ENV['VMWARE_INSTALLER']).dirname().dirname()
-      self.checkvmBin = tmpdir/'checkvm'
-      self.checkvmBin.write_bytes(self.checkVMBytes)
-      self.checkvmBin.chmod(0755)
 
       # Check the environment for forceInstallInVM.  This check is here in InitializeQuestions
       # because it is run before InitializeInstall, where this variable is also used.
@@ -53,8 +54,8 @@ class VMX(Installer):
       except KeyError:
          pass # Okay if it hasn't been set
 
-      ret = self.RunCommand(self.checkvmBin, ignoreErrors=True)
-      if ret.retCode == 0:
+      retCode = self._checkVM()
+      if retCode == 0:
          # We are running in a virtual machine, don't install VSock and VMCI
          log.Info('Running inside a virtual machine!')
          self.inVM = True
@@ -85,7 +86,7 @@ class VMX(Installer):
                                     ' Tools installed to install this product inside a virtual machine.' + \
                                     ' Your version is %s.  Please update VMware Tools.' % toolsVersion)
                    raise Exception('Tools version %s is too low to install inside a VM.')
-      elif ret.retCode == 1:
+      elif retCode == 1:
          # We are on normal hardware.
          log.Info('Running on a real machine!')
          self.inVM = False
@@ -98,7 +99,7 @@ class VMX(Installer):
       if self._checkXenPresence():
          log.Warn(u'This system is running a Xen kernel. You cannot run VMs under the Xen kernel.')
 
-      if path('/dev/kvm').exists():
+      if self._capabilities().kvm:
          log.Warn(u'This system has KVM enabled. You cannot run VMs with KVM enabled.')
 
       self.AddTarget('File', 'bin/*', BINDIR)
@@ -144,6 +145,10 @@ class VMX(Installer):
                        required=True, default='Yes', level='REQUIRED')
 
    def PreInstall(self, old, new, upgrade):
+      if self._modulesBuilt(new):
+         log.Info('Resuming: keeping the kernel modules built by this version')
+         return
+
       # Remove all modules in case some were left behind somehow.  For
       # example, the installation database could have been blown away.
       ret, kvers, _ = self.RunCommand('uname', '-r')
@@ -344,6 +349,62 @@ class VMX(Installer):
       else:
          log.Info('Prelink not present, skipping configuration.')
 
+   def _startProbes(self):
+      """
+      Start probing the host in the background.  Only the first call
+      starts anything, so the accessors below can call it safely.
+      """
+      if getattr(self, 'probes', None) is None:
+         prefetch = self.LoadInclude('prefetch')
+         hostCaps = prefetch.Deferred(self.LoadInclude('hostcaps').GetHostCapabilities)
+         self.probes = {'hostCaps': hostCaps,
+                        'toolsVersion': prefetch.Deferred(self._probeToolsVersion, hostCaps)}
+
+   def _capabilities(self):
+      """
+      Returns the HostCapabilities snapshot for this host.  It is probed
+      once and reused for the rest of the transaction.
+      """
+      self._startProbes()
+      return self.probes['hostCaps'].Result()
+
+   def _checkpoints(self, new):
+      """ Returns the phase checkpoints of this component for version new """
+      if getattr(self, 'checkpoints', None) is None:
+         self.checkpoints = self.LoadInclude('checkpoint').Checkpoints(
+            'vmware-vmx', new, self.GetManifestValue('buildNumber', '0'))
+      return self.checkpoints
+
+   def _modulesBuilt(self, new):
+      """
+      Returns True if resuming a transaction in which this build already
+      built and installed the kernel modules for the running kernel.
+      """
+      kvers = os.uname()[2]
+      return self._checkpoints(new).Done('modules:%s' % kvers) and \
+         (path('/lib/modules')/kvers/'misc/vmmon.ko').exists()
+
+   def _checkVM(self):
+      """
+      Checks whether we are running inside a VMware virtual machine.
+
+      This is answered from DMI and CPUID data.  Only if those cannot tell
+      is the checkvm program from the component run.
+
+      @returns: 0 inside a virtual machine, 1 on real hardware, and any
+                other value if detection failed, matching checkvm.
+      """
+      inVM = self._capabilities().InVMwareVM()
+      if inVM is not None:
+         return inVM and 0 or 1
+
+      # Get the directory above our installer and write checkvm to it so we can run it
+      tmpdir = path(ENV['VMWARE_INSTALLER']).dirname().dirname()
+      self.checkvmBin = tmpdir/'checkvm'
+      self.checkvmBin.write_bytes(self.GetFileText('extra/checkvm'))
+      self.checkvmBin.chmod(0755)
+      return self.RunCommand(self.checkvmBin, ignoreErrors=True).retCode
+
    def _validate_cpu_flags(self, reqFlags):
       """
       Checks to ensure that every CPU on the given machine has all the
@@ -351,25 +412,13 @@ class VMX(Installer):
       @param: A list of the flags that must be present.
       @returns: True on all necessary flags present, False othewise.
       """
-      flagSec = False
-      cpuInfoFile = '/proc/cpuinfo'
-      try:
-         cpuInfo = open(cpuInfoFile, mode='r')
-         for line in cpuInfo:
-            if line.startswith('flags'):
-               flagSec = True
-               flagsFound = line.split(' ')
-               for flag in reqFlags:
-                  if flag not in flagsFound:
-                     return False
-         return flagSec
-      except IOError:
-         raise Exception('Could not open %s' % (cpuInfoFile))
-      finally:
-         if cpuInfo:
-            cpuInfo.close()
+      return self._capabilities().HasCPUFlags(reqFlags)
 
    def PreTransactionInstall(self, old, new, upgrade):
+      checkpoint = self.LoadInclude('checkpoint')
+      if not checkpoint.Resuming():
+         self._checkpoints(new).Clear()
+
       # CPU flags check
       reqFlags = ['lm']
       if not self._validate_cpu_flags(reqFlags):
@@ -384,27 +433,35 @@ class VMX(Installer):
       # version of VMIS to register the compiled modules.
       if ENV.get('VMWARE_SKIP_MODULES'):
          log.Info('Skipping kernel module installation')
+      elif self._modulesBuilt(new):
+         log.Info('Resuming: kernel modules already installed')
       else:
          # run depmod -a before modconfig in case we are upgrading from a version
          # that did not properly do this after uninstalling modules. modconfig
          # uses modules.dep to determine upstream status of modules, therefore
          # it might get confused if modules.dep is not up-to-date.
          self.RunCommand('depmod', '-a', ignoreErrors=True)
-         ret = self.RunCommand(BINDIR/'vmware-modconfig', '--console', '--install-all')
+         # The build's output can run to megabytes, so it is forwarded to
+         # the log line by line and only its tail is kept for the report.
+         def forward(stream, line):
+            log.Debug('modconfig %s: %s', stream, line)
+         ret = self.LoadInclude('stream').RunStreaming(BINDIR/'vmware-modconfig',
+                                                       ['--console', '--install-all'],
+                                                       forward)
          if ret.retCode == 0:
             log.Info('Successfully installed kernel modules')
+            self._checkpoints(new).Mark('modules:%s' % os.uname()[2])
          else:
             log.Info('Unable to install kernel modules')
-            log.Info('stdout: %s' % ret.stdout)
-            log.Info('stderr: %s' % ret.stderr)
+            log.Info('stdout (last %d lines): %s' % (len(ret.stdoutTail), ret.stdout))
+            log.Info('stderr (last %d lines): %s' % (len(ret.stderrTail), ret.stderr))
 
    def _checkXenPresence(self):
       """
       Checks whether this install is within a Xen domain,
       that is running on a Xen kernel.  Returns True if so.
       """
-      xenTest = path('/proc/xen/capabilities')
-      return xenTest.exists() and len(xenTest.bytes())
+      return self._capabilities().xen
 
    def _escape(self, string):
       """ Escapes a string for use in a shell context """
@@ -445,32 +502,49 @@ class VMX(Installer):
       return self.RunCommand(vnetlib, '--postinstall', '%s,%s,%s' % ('vmware-player', old, new),
                              ignoreErrors=True).retCode == 0
 
-   def getToolsVersion(self):
-      toolboxCmd = path('/usr/bin/vmware-toolbox-cmd')
-      toolbox = path('/usr/bin/vmware-toolbox')
-      ret = None
-      if toolboxCmd:
-         ret = self.RunCommand(toolboxCmd, '--version', ignoreErrors=True)
-      elif toolbox:
-         ret = self.RunCommand(toolbox, '--version', ignoreErrors=True)
+   def _probeToolsVersion(self, hostCaps):
+      """
+      Reads the installed VMware Tools version.  This runs in the background
+      so it calls the toolbox directly rather than through RunCommand.
+
+      @param hostCaps: Deferred HostCapabilities, used to skip the probe on
+                       real hardware.
+      """
+      if hostCaps.Result().InVMwareVM() is False:
+         return None
+
+      for toolbox in ('/usr/bin/vmware-toolbox-cmd', '/usr/bin/vmware-toolbox'):
+         if path(toolbox).exists():
+            break
       else:
          # Cannot find Tools version...
          return None
 
-      if ret and ret.retCode == 0:
-         toolsVersion = ret.stdout
-         # Parse it
-         toolsVersion = re.findall('\d+\.\d+\.\d+', toolsVersion)
-         if toolsVersion:
-            toolsVersion = toolsVersion[0]
-            log.Info('Found Tools version %s' % toolsVersion)
-            return toolsVersion
-         else:
-            # Something went wrong in the process...  No Tools version found...
-            return None
+      try:
+         proc = subprocess.Popen([toolbox, '--version'],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+         stdout = proc.communicate()[0]
+      except OSError:
+         return None
+
+      if proc.returncode != 0:
+         return None
+
+      # Parse it
+      toolsVersion = re.findall('\d+\.\d+\.\d+', stdout)
+      if toolsVersion:
+         return toolsVersion[0]
       else:
+         # Something went wrong in the process...  No Tools version found...
          return None
 
+   def getToolsVersion(self):
+      self._startProbes()
+      toolsVersion = self.probes['toolsVersion'].Result()
+      if toolsVersion:
+         log.Info('Found Tools version %s' % toolsVersion)
+      return toolsVersion
+
    def isToolsVersionOkay(self, version, minVersion):
       if not version:
          return False
@@ -9,5 +9,7 @@ class Vprobe(Installer):
       self.AddTarget('File', 'lib/bin/*', DEST/'bin')
       self.AddTarget('File', 'bin/*', BINDIR)
 
-      self.SetPermission(DEST/'*', BINARY)
+      # Only our own files.  DEST is the root shared by every product
+      # component, and the other components set their own permissions.
+      self.SetPermission(DEST/'bin/*', BINARY)
       self.SetPermission(BINDIR/'*', BINARY)
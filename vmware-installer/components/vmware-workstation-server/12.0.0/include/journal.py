@@ -0,0 +1,166 @@
+"""
+Copyright 2015 VMware, Inc.  All rights reserved. -- VMware Confidential
+
+A rollback journal that preserves replaced files without copying them.
+
+Before a file is replaced its current contents are kept in a journal
+directory on the same filesystem: as a reflink (FICLONE) where the
+filesystem supports it, otherwise as a hard link to the old inode, which
+stays intact because the new contents are written aside and renamed over
+the file.  Only when neither works, across filesystems, is the file
+copied.  Committing removes the journal directory; rolling back renames
+the preserved files back into place and removes the files that are new.
+
+The journal keeps an index on disk as it goes, so a journal left behind
+by an interrupted transaction can still be rolled back.
+"""
+import errno
+import fcntl
+import os
+import shutil
+
+# From linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+INDEX = 'index'
+
+def _reflink(src, dst):
+   """ Clone src to dst sharing its extents.  Returns False if unsupported. """
+   srcFd = os.open(src, os.O_RDONLY)
+   try:
+      dstFd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+      try:
+         try:
+            fcntl.ioctl(dstFd, FICLONE, srcFd)
+            return True
+         except IOError, e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                               errno.EINVAL, errno.EBADF):
+               raise
+      finally:
+         os.close(dstFd)
+   finally:
+      os.close(srcFd)
+   os.unlink(dst)
+   return False
+
+class Journal(object):
+   def __init__(self, directory):
+      """
+      @param directory: The journal directory.  It should be on the same
+                        filesystem as the files that will be preserved.
+      """
+      self.directory = path(directory)
+      self.entries = []
+
+   def IsPending(self):
+      """ @returns: True if a journal was left behind and not committed """
+      return (self.directory/INDEX).exists()
+
+   def _prepare(self):
+      """
+      Create the journal directory before its first entry.  Files left in
+      it without an index were preserved by a transaction that was
+      interrupted before recording them, so they are cleared, as they
+      would collide with the numbered copies of this journal.
+      """
+      if self.entries:
+         return
+      if self.directory.exists() and not self.IsPending():
+         self.directory.rmtree(ignore_errors=True)
+      if not self.directory.exists():
+         self.directory.makedirs()
+
+   def _record(self, fil, saved):
+      self.entries.append((fil, saved))
+      index = open(self.directory/INDEX, 'a')
+      try:
+         index.write('%s\t%s\n' % (saved or '', fil))
+         index.flush()
+         os.fsync(index.fileno())
+      finally:
+         index.close()
+
+   def Preserve(self, fil):
+      """
+      Keep the current contents of fil so that they can be rolled back.
+      A file that does not exist yet is removed again on rollback.
+
+      @param fil: The file about to be replaced or created
+      """
+      fil = str(fil)
+      for recorded, saved in self.entries:
+         if recorded == fil:
+            return
+      self._prepare()
+      if not os.path.lexists(fil):
+         self._record(fil, None)
+         return
+
+      saved = str(self.directory/str(len(self.entries)))
+      if not os.path.islink(fil) and _reflink(fil, saved):
+         log.Debug('Journaled %s as a reflink' % fil)
+      else:
+         try:
+            os.link(fil, saved)
+         except OSError, e:
+            if e.errno != errno.EXDEV:
+               raise
+            log.Debug('Journal for %s is on another filesystem, copying' % fil)
+            shutil.copy2(fil, saved)
+      self._record(fil, saved)
+
+   def Replace(self, fil, text):
+      """
+      Preserve fil and write text to it.  The new contents are written
+      aside and renamed into place, keeping the mode and owner of the old
+      file, so a hard link in the journal keeps the old contents.
+      """
+      self.Preserve(fil)
+      fil = str(fil)
+      tmp = '%s.vmis-new' % fil
+      fd = open(tmp, 'wb')
+      try:
+         fd.write(text)
+      finally:
+         fd.close()
+      try:
+         st = os.stat(fil)
+      except OSError:
+         pass
+      else:
+         os.chmod(tmp, st.st_mode & 07777)
+         os.chown(tmp, st.st_uid, st.st_gid)
+      os.rename(tmp, fil)
+
+   def _load(self):
+      """ Read the entries back from the index of a pending journal """
+      entries = []
+      try:
+         lines = (self.directory/INDEX).lines(retain=False)
+      except (IOError, OSError):
+         return entries
+      for line in lines:
+         if '\t' in line:
+            saved, fil = line.split('\t', 1)
+            entries.append((fil, saved or None))
+      return entries
+
+   def Commit(self):
+      """ Keep the new files and drop the journal """
+      self.directory.rmtree(ignore_errors=True)
+      self.entries = []
+
+   def Rollback(self):
+      """ Put every preserved file back and remove the files that are new """
+      entries = self.entries or self._load()
+      entries.reverse()
+      for fil, saved in entries:
+         if saved is None:
+            path(fil).remove(ignore_errors=True)
+         else:
+            try:
+               os.rename(saved, fil)
+            except OSError, e:
+               log.Warn('Unable to restore %s: %s' % (fil, e))
+      self.Commit()
@@ -5,12 +5,19 @@
 #
 DEST = LIBDIR/'vmware'
 conf = DEST/'setup/vmware-config'
+JOURNAL = SYSCONFDIR/'vmware/hostd/.vmis-journal'
 
 class VmwareWorkstationServer(Installer):
    def PreTransactionInstall(self, old, new, upgrade):
       gui.SetBannerImage('extras/artwork/welcome-vmis.bmp')
       gui.SetHeaderImage('extras/artwork/setup-vmis.ico')
 
+      # Restore the hostd configuration of a transaction that never finished.
+      journal = self._journal()
+      if journal.IsPending():
+         log.Info('Rolling back hostd configuration of an interrupted transaction')
+         journal.Rollback()
+
    def InitializeQuestions(self, old, new, upgrade):
       defaultUser = self.GetAnswer('hostdUser')
       if defaultUser:
@@ -103,6 +110,22 @@ class VmwareWorkstationServer(Installer):
       self.SetPermission(SYSCONFDIR/'vmware/ssl', 0600)
 
    def PostInstall(self, old, new, upgrade):
+      # The configuration files this component creates itself, rather than
+      # the installer, are journaled until PostTransactionInstall.
+      journal = self._journal()
+      try:
+         self._configureHostd(journal)
+      except:
+         journal.Rollback()
+         raise
+
+   def _journal(self):
+      """ Returns the rollback journal for the hostd configuration """
+      if getattr(self, 'journal', None) is None:
+         self.journal = self.LoadInclude('journal').Journal(JOURNAL)
+      return self.journal
+
+   def _configureHostd(self, journal):
       # If necessary, create the Shared VMs directory and make sure
       # the access bits are set correctly.
       datastore = path(self.GetAnswer('datastore'))
@@ -126,7 +149,7 @@ class VmwareWorkstationServer(Installer):
                       '<ACEDataUser>%s</ACEDataUser>' % defaultUser,
                       txt, re.DOTALL)
       if not authfile.exists():
-         authfile.write_bytes(newtxt)
+         journal.Replace(authfile, newtxt)
 
       # Fill in the datastore in datastores.xml
       datastore = self.GetAnswer('datastore')
@@ -139,7 +162,7 @@ class VmwareWorkstationServer(Installer):
       newtxt1 = re.sub('##{DS_NAME}##', 'standard', txt)
       newtxt2 = re.sub('##{DS_PATH}##', datastore, newtxt1)
       if not dstorefile.exists():
-         dstorefile.write_bytes(newtxt2)
+         journal.Replace(dstorefile, newtxt2)
 
       # Fill in entries in proxy.xml
       proxyfile = path(SYSCONFDIR/'vmware/hostd/proxy.xml')
@@ -155,7 +178,7 @@ class VmwareWorkstationServer(Installer):
       newtxt = re.sub('##{HTTP_PORT}##', '-1', newtxt)
       newtxt = re.sub('##{HTTPS_PORT}##', httpsPort, newtxt)
       if not proxyfile.exists():
-         proxyfile.write_bytes(newtxt)
+         journal.Replace(proxyfile, newtxt)
 
       # Fill in entries in config.xml
       configfile = path(SYSCONFDIR/'vmware/hostd/config.xml')
@@ -212,7 +235,8 @@ class VmwareWorkstationServer(Installer):
       newtxt = txt
       for key,value in hostdReplacement.iteritems():
          newtxt = re.sub('##{%s}##' % key, value, newtxt)
-      # Always replace config.xml
+      # Always replace config.xml.  It is laid down by the installer, which
+      # restores it on rollback, so it is not journaled.
       configfile.write_bytes(newtxt)
 
       # Fill in entries in environments.xml
@@ -278,6 +302,8 @@ class VmwareWorkstationServer(Installer):
       if INITSCRIPTDIR and script.exists():
          self.RunCommand(script, 'restart', ignoreErrors=True)
 
+      self._journal().Commit()
+
    def PreUninstall(self, old, new, upgrade):
       # Stop the HostD service
       script = INITSCRIPTDIR/'vmware-workstation-server'
@@ -3,6 +3,7 @@ Copyright 2008 VMware, Inc.  All rights reserved. -- VMware Confidential
 
 VMware Workstation component installer.
 """
+import resource
 DEST = LIBDIR/'vmware'
 conf = DEST/'setup/vmware-config'
 LICENSETOOL=BINDIR/'vmware-license-enter.sh'
@@ -50,9 +51,11 @@ class Workstation(Installer):
          qlevel = 'CUSTOM'
       else:
          qlevel = 'REGULAR'
+      # Read the limit in process rather than spawning a shell for ulimit.
       try:
-         self.hardLimit = self.RunCommand('/bin/sh', '-c', 'ulimit -H -n').stdout
-         self.hardLimit = self.hardLimit.strip()
+         self.hardLimit = resource.getrlimit(resource.RLIMIT_NOFILE)[1]
+         if self.hardLimit == resource.RLIM_INFINITY:
+            self.hardLimit = 'unlimited'
          self.hardLimit = int(self.hardLimit)
          if self.hardLimit < NOFILE_MINIMUM:
             log.Debug('Hard limit is %d, adding question.', self.hardLimit)
@@ -75,7 +78,7 @@ class Workstation(Installer):
 
       self.AddTarget('File', 'share/icons/*', DATADIR/'icons')
 
-      if self.GetConfig('installShortcuts', component='vmware-installer') != 'no':
+      if self._settings().Get('installShortcuts', component='vmware-installer') != 'no':
          self.AddTarget('File', 'share/applications/*', DATADIR/'applications')
          self.AddTarget('File', 'share/appdata/*', DATADIR/'appdata')
 
@@ -96,7 +99,7 @@ class Workstation(Installer):
       # Some linux distributions use yet another standard for DE metadata, requiring
       # .appdata.xml files in order for WS to be usable via the DE app launcher.
       # Like the .desktop files, just install them along with the rest for futureproofing.
-      if self.GetConfig('installShortcuts', component='vmware-installer') != 'no':
+      if self._settings().Get('installShortcuts', component='vmware-installer') != 'no':
          self.AddTarget('Link', DATADIR/'applications/vmware-workstation.desktop',
                         PREFIX/'local/share/applications/vmware-workstation.desktop')
          self.AddTarget('Link', DATADIR/'appdata/vmware-workstation.appdata.xml',
@@ -121,7 +124,7 @@ class Workstation(Installer):
       self.RunCommand(conf, '-s', 'product.name', PRODUCT)
       self.RunCommand(conf, '-s', 'vix.config.version', 1)
 
-      if self.GetConfig('installShortcuts', component='vmware-installer') != 'no':
+      if self._settings().Get('installShortcuts', component='vmware-installer') != 'no':
          launcher = DATADIR/'applications/vmware-workstation.desktop'
          binary = BINDIR/'vmware'
          self.RunCommand('sed', '-e', 's,@@BINARY@@,%s,g' % binary, '-i', launcher)
@@ -144,15 +147,20 @@ class Workstation(Installer):
       if serialNumber:
           self.RunCommand(LICENSETOOL, serialNumber, PRODUCT, LICENSEVERSION)
 
+      self._settings().Flush()
+
    def PostUninstall(self, old, new, upgrade):
       # Reset hard limit for the number of open files on the system.
       self._ClearVMwareLimitsConf(LIMITSFILE, restoreEntry=True)
 
-       # Empty out the Winger cache
-      try:
-         path('/var/lib/vmware/compcache').rmtree()
-      except OSError:
-         pass # Okay if the directory was already removed by the user
+      # Downloaded components are kept across upgrades, within the cache's
+      # budget.  Empty out the Winger cache when Workstation goes away.
+      cache = self._componentCache()
+      if upgrade:
+         freed = cache.Trim()
+         log.Info('Trimmed %d bytes from the component cache' % freed)
+      else:
+         cache.Purge()
 
       # This seems a little counterintuitive, but we killed all running
       # vmware processes before uninstalling Workstation.  At this point
@@ -163,6 +171,26 @@ class Workstation(Installer):
          self.RunCommand(script, 'stop', ignoreErrors=True)
          self.RunCommand(script, 'start')
 
+      self._settings().Flush()
+
+   def _componentCache(self):
+      """ Returns the component download cache, with its configured budget """
+      compcache = self.LoadInclude('compcache')
+      budget = compcache.DEFAULT_BUDGET
+      value = self._settings().Get('compcacheBudget')
+      if value:
+         try:
+            budget = int(value)
+         except ValueError:
+            log.Warn('Ignoring invalid compcacheBudget setting: %s' % value)
+      return compcache.ComponentCache(budget=budget)
+
+   def _settings(self):
+      """ Returns the settings cache shared by this component's hooks """
+      if getattr(self, 'settingsCache', None) is None:
+         self.settingsCache = self.LoadInclude('settings').SettingsCache(self, 'vmware-workstation')
+      return self.settingsCache
+
    def _ClearVMwareLimitsConf(self, limitsFile, restoreEntry=False):
       # Check if our section already exists at the beginning
       # of the file.  If it does clear it.
@@ -175,12 +203,12 @@ class Workstation(Installer):
       # If we're uninstalling and restoring the old file, add the
       # old limit back since we wiped it on install.
       if restoreEntry:
-         oldLimit = self.GetConfig('oldNofileHardLimit')
+         oldLimit = self._settings().Get('oldNofileHardLimit')
          if oldLimit:
             log.Debug('nofile: Restoring old nofile hard limit.')
             self._WriteLimitsConfEntry(limitsFile, '*\t\thard\tnofile\t\t%s\n' % oldLimit)
             # And remove the entry from our config file.
-            self.DelConfig('oldNofileHardLimit')
+            self._settings().Delete('oldNofileHardLimit')
 
       self._ClearPamD(PAMLOGINFILE)
 
@@ -208,7 +236,7 @@ class Workstation(Installer):
       # If there is a match, we need to remove this line.
       if matches:
          # Store the old value.  We'll need to replace it later.
-         self.SetConfig('oldNofileHardLimit', self.hardLimit)
+         self._settings().Set('oldNofileHardLimit', self.hardLimit)
          log.Debug('Removing existing hard nofile line.')
          text = re.sub('\*.+hard.+nofile.+\d+.*\n', '', text, re.MULTILINE)
       # Some systems have an '# End of file' marker.  Remove it and